@@ -8,11 +8,27 @@ Usage:
 """
 
 import sys
+import json
+import time
+import random
 
-from itertools import chain, combinations
+from itertools import chain, combinations, count as counter
+from functools import reduce
 from collections import defaultdict
+from heapq import heappush, heapreplace
+from math import comb, log, sqrt
 from optparse import OptionParser
 
+from counting import (returnItemsWithMinSupportWeighted,
+                      returnItemsWithMinSupportVertical, tidListToBitset,
+                      joinSet, getItemSetTransactionList, makeItemFilter,
+                      getMissingSubsets, levelStats, peakMemoryKB,
+                      getFrequentItemSetsStore)
+from fpgrowth import findFrequentItemSets
+from transaction_store import TransactionStore
+from itemset_cache import ItemSetCache
+from result_writer import openResultWriter
+
 
 def subsets(arr):
     """ Returns non empty subsets of arr"""
@@ -40,30 +56,248 @@ def returnItemsWithMinSupport(itemSet, transactionList, minSupport, freqSet):
         return _itemSet
 
 
-def joinSet(itemSet, length):
-        """Join a set with itself and returns the n-element itemsets"""
-        return set([i.union(j) for i in itemSet for j in itemSet if len(i.union(j)) == length])
+def generateRules(largeSet, freqSet, transactionCount, minConfidence,
+                  topK=None, rankBy='confidence', onRule=None):
+    """
+    Returns the association rules ((pretuple, posttuple), confidence)
+    of the frequent itemSets in largeSet. The consequents of every itemSet are
+    grown one item at a time and only from consequents whose rule satisfies
+    minConfidence, since moving an item from the antecedent to the consequent
+    can only lower the confidence.
+    With topK, only the topK best rules ranked by rankBy ('confidence' or
+    'lift') are kept in a heap, and they are returned best first.
+    Otherwise, if onRule is given, every rule is passed to it as soon as it is
+    found instead of being returned
+    """
+    def getSupport(item):
+            """local function which Returns the support of an item"""
+            return float(freqSet[item])/transactionCount
 
+    toRetRules = []
+    heap = []
+    order = counter()
+    for key, value in list(largeSet.items())[1:]:
+        for item in value:
+            itemSupport = getSupport(item)
+            consequents = set(frozenset([element]) for element in item)
+            length = 1
+            while consequents and length < len(item):
+                kept = set()
+                for remain in consequents:
+                    element = item.difference(remain)
+                    confidence = itemSupport/getSupport(element)
+                    if confidence < minConfidence:
+                        continue
+                    rule = ((tuple(element), tuple(remain)), confidence)
+                    score = confidence
+                    if rankBy == 'lift':
+                        score = confidence / getSupport(remain)
+                    if topK is None:
+                        if onRule is None:
+                            toRetRules.append(rule)
+                        else:
+                            onRule(rule)
+                    elif len(heap) < topK:
+                        heappush(heap, (score, next(order), rule))
+                    elif heap and score > heap[0][0]:
+                        heapreplace(heap, (score, next(order), rule))
+                    elif rankBy == 'confidence':
+                        # larger consequents cannot beat the worst kept rule
+                        continue
+                    kept.add(remain)
+                length = length + 1
+                consequents = joinSet(kept, length)
+
+    if topK is not None:
+        toRetRules = [rule for score, i, rule in sorted(heap, reverse=True)]
+    return toRetRules
+
+
+def generateItemsAndRules(largeSet, freqSet, transactionCount, minConfidence,
+                          topK=None, rankBy='confidence'):
+    """
+    Returns both the frequent items and the association rules built from the
+    frequent itemSets in largeSet and their support counts in freqSet
+    """
+    def getSupport(item):
+            """local function which Returns the support of an item"""
+            return float(freqSet[item])/transactionCount
 
-def getItemSetTransactionList(data_iterator):
-    transactionList = list()
-    itemSet = set()
-    for record in data_iterator:
-        transaction = frozenset(record)
-        transactionList.append(transaction)
-        for item in transaction:
-            itemSet.add(frozenset([item]))              # Generate 1-itemSets
-    return itemSet, transactionList
+    toRetItems = []
+    for key, value in largeSet.items():
+        toRetItems.extend([(tuple(item), getSupport(item))
+                           for item in value])
+
+    toRetRules = generateRules(largeSet, freqSet, transactionCount,
+                               minConfidence, topK=topK, rankBy=rankBy)
+    return toRetItems, toRetRules
 
 
-def runApriori(data_iter, minSupport, minConfidence):
+def filterLevel(itemSets, nextLevel, freqSet, mode):
+    """Returns the itemSets of a level which are closed (mode='closed') or
+    maximal (mode='maximal') given the frequent itemSets of the next level.
+    An itemSet is not closed if an immediate superset has the same support,
+    and not maximal if any immediate superset is frequent.
+    This filters an already mined output (FP-Growth, store and sample runs);
+    the apriori search itself prunes with getGenerators instead"""
+    if mode == 'all':
+        return itemSets
+    covered = set()
+    for item in nextLevel:
+        for element in item:
+            subset = item.difference([element])
+            if mode == 'maximal' or freqSet[subset] == freqSet[item]:
+                covered.add(subset)
+    return itemSets.difference(covered)
+
+
+def filterItemSets(largeSet, freqSet, mode):
+    """Same as filterLevel, for every level of an already mined largeSet"""
+    keys = sorted(largeSet)
+    return dict((k, filterLevel(largeSet[k], largeSet.get(k + 1, set()),
+                                freqSet, mode))
+                for k in keys)
+
+
+def getGenerators(itemSets, freqSet, transactionCount):
+    """Returns the generators of itemSets: the itemSets whose support count is
+    lower than that of each of their (k-1)-subsets (than transactionCount, the
+    count of the empty set, for 1-itemSets). If X is not a generator, X minus
+    some element e always occurs with e, so every superset of X has the same
+    count as itself without e: it is neither closed nor worth counting, and
+    only the generators are joined into the next level (A-Close, Pasquier et
+    al., 1999)"""
+    generators = set()
+    for item in itemSets:
+        itemCount = freqSet[item]
+        if len(item) == 1:
+            parents = (transactionCount,)
+        else:
+            parents = (freqSet[item.difference([element])] for element in item)
+        if all(itemCount < parent for parent in parents):
+            generators.add(item)
+    return generators
+
+
+def getClosedItemSets(generators, transactionList, elements, freqSet,
+                      transactionCount):
+    """Returns the closed itemSets (key=itemSet, value=support count) as the
+    closures of the generators (and of the empty set): the elements contained
+    in every transaction containing the generator, which have its count.
+    elements are the frequent single items"""
+    tidLists = defaultdict(list)
+    for tid, transaction in enumerate(transactionList):
+        for element in transaction:
+            if element in elements:
+                tidLists[element].append(tid)
+    bitsets = dict((element, tidListToBitset(tids))
+                   for element, tids in tidLists.items())
+
+    closedSets = dict()
+    every = (1 << len(transactionList)) - 1
+    for generator in chain([frozenset()], generators):
+        bits = reduce(lambda bits, element: bits & bitsets[element], generator,
+                      every)
+        closure = frozenset(element for element, elementBits in bitsets.items()
+                            if elementBits & bits == bits)
+        if closure:
+            closedSets[closure] = freqSet[generator] if generator \
+                else transactionCount
+    return closedSets
+
+
+def getClosedSetIndex(closedSets):
+    """Returns the closed itemSets sorted by decreasing support count and, for
+    each element, the bitset of the indexes of the closed itemSets containing
+    it: the closed supersets of an itemSet are the intersection of the
+    bitsets of its elements"""
+    ordered = sorted(closedSets, key=closedSets.get, reverse=True)
+    containing = defaultdict(list)
+    for i, item in enumerate(ordered):
+        for element in item:
+            containing[element].append(i)
+    return ordered, dict((element, tidListToBitset(indexes))
+                         for element, indexes in containing.items())
+
+
+def closedSupersets(item, containing):
+    """Returns the bitset of the closed supersets of item (see
+    getClosedSetIndex)"""
+    return reduce(lambda bits, other: bits & other,
+                  (containing[element] for element in item))
+
+
+def getMaximalItemSets(closedSets):
+    """Returns the maximal itemSets: every frequent superset of an itemSet
+    has a closed superset, so they are the closed itemSets without any closed
+    proper superset"""
+    ordered, containing = getClosedSetIndex(closedSets)
+    return set(item for item in ordered
+               if bin(closedSupersets(item, containing)).count('1') == 1)
+
+
+def getUncountedSubsets(largeSet, freqSet):
+    """Returns the itemSets of largeSet and their subsets which were not
+    counted in a search pruned to the generators. A candidate is only counted
+    if all its subsets were, so the subsets of a counted itemSet are not
+    visited"""
+    uncounted = set()
+    stack = [item for value in largeSet.values() for item in value
+             if item not in freqSet]
+    uncounted.update(stack)
+    while stack:
+        item = stack.pop()
+        for element in item:
+            subset = item.difference([element])
+            if subset and subset not in freqSet and subset not in uncounted:
+                uncounted.add(subset)
+                stack.append(subset)
+    return uncounted
+
+
+def inferSupportCounts(itemSets, closedSets, freqSet):
+    """Adds to freqSet the counts of itemSets, frequent itemsets that were not
+    counted because they contain a non generator: the count of an itemset is
+    that of its closure, its closed superset with the highest count"""
+    ordered, containing = getClosedSetIndex(closedSets)
+    for item in itemSets:
+        bits = closedSupersets(item, containing)
+        freqSet[item] = closedSets[ordered[(bits & -bits).bit_length() - 1]]
+
+
+def getFrequentItemSets(data_iter, minSupport, counting='horizontal',
+                        onLevel=None, mode='all', maxLen=None, required=None,
+                        excluded=None, prefixes=None):
     """
-    run the apriori algorithm. data_iter is a record iterator
-    Return both:
-     - items (tuple, support)
-     - rules ((pretuple, posttuple), confidence)
+    run the apriori levels. data_iter is a record iterator
+    Return:
+     - freqSet (key=itemSet, value=support count)
+     - largeSet (key=n, value=set of frequent n-itemSets)
+     - number of transactions
+    onLevel, if given, is called at the end of every level k with a dict of
+    its candidate and frequent counts, the time spent in joinSet and in
+    support counting, and the peak memory of the process
+    mode 'closed' / 'maximal' prunes the search to the generators (see
+    getGenerators): only they are joined, so the candidates containing a non
+    generator are neither generated nor counted. largeSet then holds the
+    closed (the closures of the generators, see getClosedItemSets) or maximal
+    itemsets, and freqSet the counts of every subset of them that the rules
+    need, inferred from the closed itemsets (see inferSupportCounts). In
+    these modes maxLen and required only filter the result, since a closed
+    itemset may only have generators outside them
+    Constraints are pushed into the search: the excluded items and the items
+    not starting with one of prefixes are dropped when the transactions are
+    read, no candidate is generated beyond maxLen items, and with required
+    only the itemsets containing at least one of the required items are
+    generated (the subsets the rules need are counted at the end)
     """
-    itemSet, transactionList = getItemSetTransactionList(data_iter)
+    tidIndex = dict() if counting == 'vertical' else None
+    weights = list() if counting == 'weighted' else None
+    isAllowed = makeItemFilter(excluded, prefixes)
+    itemSet, transactionList = getItemSetTransactionList(data_iter, tidIndex,
+                                                         weights, isAllowed)
+    required = frozenset(required) if required else None
+    transactionCount = len(transactionList) if weights is None else sum(weights)
 
     freqSet = defaultdict(int)
     largeSet = dict()
@@ -73,62 +307,261 @@ def runApriori(data_iter, minSupport, minConfidence):
     assocRules = dict()
     # Dictionary which stores Association Rules
 
-    oneCSet = returnItemsWithMinSupport(itemSet,
-                                        transactionList,
-                                        minSupport,
-                                        freqSet)
-
+    def countSupport(candidates):
+            """local function which counts candidates with the selected engine"""
+            if weights is not None:
+                    return returnItemsWithMinSupportWeighted(candidates,
+                                                             transactionList,
+                                                             weights,
+                                                             transactionCount,
+                                                             minSupport,
+                                                             freqSet)
+            if tidIndex is None:
+                    return returnItemsWithMinSupport(candidates,
+                                                     transactionList,
+                                                     minSupport,
+                                                     freqSet)
+            return returnItemsWithMinSupportVertical(candidates,
+                                                     tidIndex,
+                                                     len(transactionList),
+                                                     minSupport,
+                                                     freqSet)
+
+    pruned = mode != 'all'
+    searchMaxLen = None if pruned else maxLen
+    searchRequired = None if pruned else required
+
+    start = time.time()
+    oneCSet = countSupport(itemSet)
+    if onLevel is not None:
+        onLevel(levelStats(1, itemSet, oneCSet, 0.0, time.time() - start))
+
+    generators = set()
     currentLSet = oneCSet
     k = 2
     while(currentLSet != set([])):
         largeSet[k-1] = currentLSet
-        currentLSet = joinSet(currentLSet, k)
-        currentCSet = returnItemsWithMinSupport(currentLSet,
-                                                transactionList,
-                                                minSupport,
-                                                freqSet)
+        if pruned:
+            currentLSet = getGenerators(currentLSet, freqSet, transactionCount)
+            generators.update(currentLSet)
+        start = time.time()
+        currentLSet = joinSet(currentLSet, k, searchMaxLen, searchRequired)
+        joined = time.time()
+        currentCSet = countSupport(currentLSet)
+        if onLevel is not None:
+            onLevel(levelStats(k, currentLSet, currentCSet,
+                               joined - start, time.time() - joined))
+        if searchRequired and k == 2:
+            # every 1-itemSet was needed for the join, only keep the required
+            largeSet[1] = set(item for item in largeSet[1]
+                              if not item.isdisjoint(required))
+        if tidIndex is not None and k > 2:
+            # bitsets of the (k-1)-itemSets are no longer needed
+            for item in largeSet[k-1]:
+                del tidIndex[item]
         currentLSet = currentCSet
         k = k + 1
 
-    def getSupport(item):
-            """local function which Returns the support of an item"""
-            return float(freqSet[item])/len(transactionList)
+    if pruned:
+        closedSets = getClosedItemSets(generators, transactionList,
+                                       set(element for item in oneCSet
+                                           for element in item),
+                                       freqSet, transactionCount)
+        kept = closedSets if mode == 'closed' else getMaximalItemSets(closedSets)
+        largeSet = dict((key, set()) for key in range(1, max(map(len, kept)) + 1)) \
+            if kept else dict()
+        for item in kept:
+            if (maxLen is None or len(item) <= maxLen) and \
+                    (not required or not item.isdisjoint(required)):
+                largeSet[len(item)].add(item)
+        # counts of the itemSets and of the subsets the rules need,
+        # without counting them
+        inferSupportCounts(getUncountedSubsets(largeSet, freqSet), closedSets,
+                           freqSet)
+    elif required:
+        countSupport(getMissingSubsets(largeSet, freqSet))
+
+    return freqSet, largeSet, transactionCount
+
+
+def countItemSetsStream(itemSets, data_iter):
+    """
+    Counts in one pass over data_iter the transactions containing each
+    itemSet of itemSets and each single item
+    Return (counts of itemSets, counts of items, number of transactions)
+    """
+    byLength = defaultdict(dict)
+    for item in itemSets:
+        if len(item) > 1:
+            byLength[len(item)][tuple(sorted(item))] = item
+
+    counts = defaultdict(int)
+    itemCounts = defaultdict(int)
+    transactionCount = 0
+    for record in data_iter:
+        transaction = frozenset(record)
+        transactionCount += 1
+        for element in transaction:
+            itemCounts[element] += 1
+        for length, candidates in byLength.items():
+            if len(transaction) < length:
+                continue
+            if comb(len(transaction), length) <= len(candidates):
+                for subset in combinations(sorted(transaction), length):
+                    item = candidates.get(subset)
+                    if item is not None:
+                        counts[item] += 1
+            else:
+                for item in candidates.values():
+                    if item.issubset(transaction):
+                        counts[item] += 1
+    return counts, itemCounts, transactionCount
+
+
+def getFrequentItemSetsSample(data_source, minSupport, sampleSize, delta=0.05,
+                              seed=None, counting='vertical'):
+    """
+    Toivonen's sampling: mines a random sample of sampleSize records at a
+    lowered support, then counts the itemsets frequent in the sample and
+    their negative border (the itemsets not frequent in the sample whose
+    subsets all are) in one pass over the whole data. data_source is a
+    function returning a fresh record iterator, called twice.
+    The support is lowered by sqrt(ln(1/delta) / (2 sampleSize)), so that a
+    frequent itemset is missed with probability about delta, but never below
+    half of minSupport. The sample is mined with the counting engine of
+    getFrequentItemSets, the whole data is always counted in a single stream
+    Return:
+     - freqSet, largeSet, number of transactions (as getFrequentItemSets)
+     - misses: itemsets of the negative border found frequent. If it is
+       empty the result is exact, otherwise supersets of the misses may be
+       frequent too and a second pass is needed
+    """
+    # 1st pass: reservoir sampling
+    rng = random.Random(seed)
+    sample = []
+    for i, record in enumerate(data_source()):
+        if i < sampleSize:
+            sample.append(frozenset(record))
+        else:
+            j = rng.randrange(i + 1)
+            if j < sampleSize:
+                sample[j] = frozenset(record)
+
+    loweredSupport = minSupport
+    if sample:
+        loweredSupport = max(minSupport - sqrt(log(1 / delta) / (2 * len(sample))),
+                             minSupport / 2)
+    sampleFreqSet, sampleLargeSet, sampleCount = getFrequentItemSets(
+        iter(sample), loweredSupport, counting)
+
+    candidates = set()
+    border = set()
+    for element in set(chain(*sample)):
+        border.add(frozenset([element]))
+    for k, value in sampleLargeSet.items():
+        candidates |= value
+        border |= joinSet(value, k + 1)
+    border -= candidates
+
+    # 2nd pass: count the candidates and their negative border
+    counts, itemCounts, transactionCount = countItemSetsStream(
+        candidates | border, data_source())
+    for element, count in itemCounts.items():
+        counts[frozenset([element])] = count
+
+    def isFrequent(count):
+            """local function, same test as returnItemsWithMinSupport"""
+            return float(count)/transactionCount >= minSupport
+
+    freqSet = dict()
+    largeSet = dict()
+    misses = []
+    for item, count in counts.items():
+        if not isFrequent(count):
+            continue
+        if item not in candidates:
+            # in the negative border, or never seen in the sample
+            misses.append(item)
+        freqSet[item] = count
+        largeSet.setdefault(len(item), set()).add(item)
+    largeSet = dict(sorted(largeSet.items()))
+    return freqSet, largeSet, transactionCount, misses
+
+
+def runApriori(data_iter, minSupport, minConfidence, counting='horizontal',
+               topK=None, rankBy='confidence', onLevel=None, mode='all',
+               maxLen=None, required=None, excluded=None, prefixes=None):
+    """
+    run the apriori algorithm. data_iter is a record iterator
+    Return both:
+     - items (tuple, support)
+     - rules ((pretuple, posttuple), confidence)
+    counting selects the support counting engine: 'horizontal' scans every
+    transaction, 'vertical' intersects tid bitsets, 'weighted' scans every
+    distinct basket once, weighted by its number of occurrences
+    topK and rankBy are passed to generateRules
+    onLevel is the per-level hook of getFrequentItemSets
+    mode selects all, closed or maximal itemsets (see getFrequentItemSets)
+    maxLen, required, excluded and prefixes are the constraints pushed into
+    the search (see getFrequentItemSets)
+    """
+    freqSet, largeSet, transactionCount = getFrequentItemSets(data_iter,
+                                                              minSupport,
+                                                              counting,
+                                                              onLevel=onLevel,
+                                                              mode=mode,
+                                                              maxLen=maxLen,
+                                                              required=required,
+                                                              excluded=excluded,
+                                                              prefixes=prefixes)
+    return generateItemsAndRules(largeSet, freqSet, transactionCount,
+                                 minConfidence, topK=topK, rankBy=rankBy)
+
+
+def runAprioriStore(store, minSupport, minConfidence, chunkSize=100000,
+                    topK=None, rankBy='confidence'):
+    """
+    same as runApriori, but mines the item ids of a TransactionStore and
+    streams its transactions chunk by chunk at every level, so that memory
+    stays bounded by chunkSize whatever the number of transactions
+    """
+    freqSet, largeSet, transactionCount = getFrequentItemSetsStore(store,
+                                                                   minSupport,
+                                                                   chunkSize)
+    return generateItemsAndRules(largeSet, freqSet, transactionCount,
+                                 minConfidence, topK=topK, rankBy=rankBy)
 
-    toRetItems = []
-    for key, value in largeSet.items():
-        toRetItems.extend([(tuple(item), getSupport(item))
-                           for item in value])
 
-    toRetRules = []
-    print(largeSet.items())
-    for key, value in list(largeSet.items())[1:]:
-        for item in value:
-            _subsets = map(frozenset, [x for x in subsets(item)])
-            for element in _subsets:
-                remain = item.difference(element)
-                if len(remain) > 0:
-                    confidence = getSupport(item)/getSupport(element)
-                    if confidence >= minConfidence:
-                        toRetRules.append(((tuple(element), tuple(remain)),
-                                           confidence))
-    return toRetItems, toRetRules
+def runFPGrowth(data_source, minSupport, minConfidence, topK=None,
+                rankBy='confidence'):
+    """
+    same as runApriori, but mines the frequent itemsets with FP-Growth.
+    data_source is a function returning a fresh record iterator, it is
+    called once per pass over the data (two passes in total)
+    """
+    freqSet, largeSet, transactionCount = findFrequentItemSets(data_source,
+                                                               minSupport)
+    return generateItemsAndRules(largeSet, freqSet, transactionCount,
+                                 minConfidence, topK=topK, rankBy=rankBy)
 
 
-def printResults(items, rules):
-    """prints the generated itemsets sorted by support and the confidence rules sorted by confidence"""
+def printResults(items, rules, out=None):
+    """prints the generated itemsets sorted by support and the confidence rules sorted by confidence
+    to out (stdout by default)"""
+    out = sys.stdout if out is None else out
     item_list = sorted(items, key=lambda x: x[1])
     for item, support in item_list:
-        print("item: %s , %.3f" % (str(item), support))
-    print("\n------------------------ RULES:")
+        print("item: %s , %.3f" % (str(item), support), file=out)
+    print("\n------------------------ RULES:", file=out)
     rule_list = sorted(rules, key=lambda x: x[1])
     for rule, confidence in rule_list:
         pre, post = rule
-        print("Rule: %s ==> %s , %.3f" % (str(pre), str(post), confidence))
+        print("Rule: %s ==> %s , %.3f" % (str(pre), str(post), confidence), file=out)
 
 
 def dataFromFile(fname):
         """Function which reads from the file and yields a generator"""
-        file_iter = open(fname, 'rU')
+        file_iter = open(fname, 'r')
         for line in file_iter:
                 line = line.strip().rstrip(',')                         # Remove trailing comma
                 record = frozenset(line.split(','))
@@ -153,6 +586,95 @@ if __name__ == "__main__":
                          default=0.6,
                          type='float')
 
+    optparser.add_option('--counting',
+                         dest='counting',
+                         help='support counting engine: horizontal, vertical or weighted (with --sample, the engine mining the sample)',
+                         default='horizontal',
+                         type='choice',
+                         choices=['horizontal', 'vertical', 'weighted'])
+
+    optparser.add_option('-a', '--algorithm',
+                         dest='algorithm',
+                         help='mining algorithm: apriori or fpgrowth',
+                         default='apriori',
+                         type='choice',
+                         choices=['apriori', 'fpgrowth'])
+
+    optparser.add_option('--store',
+                         dest='store',
+                         help='path of an on-disk transaction store, (re)built from the input if missing, incomplete or older than the input',
+                         default=None)
+    optparser.add_option('--chunkSize',
+                         dest='chunkSize',
+                         help='number of transactions streamed at once from the store',
+                         default=100000,
+                         type='int')
+
+    optparser.add_option('-t', '--topK', '--top',
+                         dest='topK',
+                         help='only keep the topK best rules',
+                         default=None,
+                         type='int')
+    optparser.add_option('-r', '--rankBy',
+                         dest='rankBy',
+                         help='rule ranking used by --topK: confidence or lift',
+                         default='confidence',
+                         type='choice',
+                         choices=['confidence', 'lift'])
+
+    optparser.add_option('--cache',
+                         dest='cache',
+                         help='directory caching the frequent itemsets of the input file',
+                         default=None)
+
+    optparser.add_option('-m', '--mode',
+                         dest='mode',
+                         help='itemsets to keep: all, closed or maximal (the apriori engines only extend generators; fpgrowth, --store and --sample filter after mining)',
+                         default='all',
+                         type='choice',
+                         choices=['all', 'closed', 'maximal'])
+    optparser.add_option('--sample',
+                         dest='sample',
+                         help='mine a random sample of this many transactions, then verify it in one pass',
+                         default=None,
+                         type='int')
+    optparser.add_option('--sampleDelta',
+                         dest='sampleDelta',
+                         help='probability of missing a frequent itemset allowed when lowering the sample support',
+                         default=0.05,
+                         type='float')
+    optparser.add_option('--max-len',
+                         dest='maxLen',
+                         help='maximum number of items of the itemsets',
+                         default=None,
+                         type='int')
+    optparser.add_option('--require',
+                         dest='required',
+                         help='comma separated items, every itemset must contain one of them',
+                         default=None)
+    optparser.add_option('--exclude',
+                         dest='excluded',
+                         help='comma separated items to ignore',
+                         default=None)
+    optparser.add_option('--prefix',
+                         dest='prefixes',
+                         help='comma separated prefixes, only the items starting with one of them are mined',
+                         default=None)
+    optparser.add_option('-o', '--output',
+                         dest='output',
+                         help='file the results are written to (stdout by default); text is sorted first, the other formats are streamed',
+                         default=None)
+    optparser.add_option('--format',
+                         dest='format',
+                         help='output format: text (sorted, as printResults), csv, jsonl or binary',
+                         default='text',
+                         type='choice',
+                         choices=['text', 'csv', 'jsonl', 'binary'])
+    optparser.add_option('--profile-json',
+                         dest='profile',
+                         help='write the per-level statistics of the run to this json file',
+                         default=None)
+
     (options, args) = optparser.parse_args()
 
     inFile = None
@@ -166,7 +688,114 @@ if __name__ == "__main__":
 
     minSupport = options.minS
     minConfidence = options.minC
-
-    items, rules = runApriori(inFile, minSupport, minConfidence)
-
-    printResults(items, rules)
+    required, excluded, prefixes = [None if value is None else value.split(',')
+                                    for value in (options.required,
+                                                  options.excluded,
+                                                  options.prefixes)]
+    constrained = any(value is not None for value in (options.maxLen, required,
+                                                      excluded, prefixes))
+    if constrained and (options.store is not None or
+                        options.algorithm == 'fpgrowth' or
+                        options.sample is not None):
+        sys.exit('--max-len, --require, --exclude and --prefix are only '
+                 'supported by the in-memory apriori engines')
+    if options.store is not None and options.sample is not None:
+        sys.exit('--sample is not supported with --store, '
+                 'run it on the input file without --store')
+
+    cache = None
+    mined = None
+    if options.cache is not None and options.input is not None \
+            and options.mode == 'all' and not constrained:
+        cache = ItemSetCache(options.cache)
+        mined = cache.load(options.input, minSupport)
+
+    levels = []
+    start = time.time()
+    if mined is None:
+        if options.store is not None:
+            # 入力が標準入力の場合は内容を確かめられないので毎回作り直す
+            if options.input is not None and \
+                    TransactionStore.exists(options.store, options.input):
+                store = TransactionStore(options.store)
+            else:
+                store = TransactionStore.build(inFile, options.store,
+                                               source=options.input)
+            mined = getFrequentItemSetsStore(store, minSupport, options.chunkSize)
+            store.close()
+        elif options.algorithm == 'fpgrowth' or options.sample is not None:
+            if options.input is None:
+                records = list(inFile)
+                dataSource = lambda: iter(records)
+            else:
+                dataSource = lambda: dataFromFile(options.input)
+            if options.sample is not None:
+                mined = getFrequentItemSetsSample(dataSource, minSupport,
+                                                  options.sample,
+                                                  options.sampleDelta,
+                                                  counting=options.counting)
+                misses = mined[3]
+                mined = mined[:3]
+                if misses:
+                    sys.stderr.write('sampling: %d itemsets of the negative border are frequent, '
+                                     'a second pass is needed for an exact result\n' % len(misses))
+                else:
+                    sys.stderr.write('sampling: exact result\n')
+            else:
+                mined = findFrequentItemSets(dataSource, minSupport)
+        else:
+            mined = getFrequentItemSets(inFile, minSupport, options.counting,
+                                        onLevel=levels.append,
+                                        mode=options.mode,
+                                        maxLen=options.maxLen,
+                                        required=required,
+                                        excluded=excluded,
+                                        prefixes=prefixes)
+        if cache is not None and options.sample is None:
+            cache.save(options.input, minSupport, *mined)
+
+    freqSet, largeSet, transactionCount = mined
+    if options.mode != 'all' and (options.store is not None or
+                                  options.algorithm == 'fpgrowth' or
+                                  options.sample is not None):
+        largeSet = filterItemSets(largeSet, freqSet, options.mode)
+    miningTime = time.time() - start
+    if options.format == 'text':
+        items, rules = generateItemsAndRules(largeSet, freqSet, transactionCount,
+                                             minConfidence, topK=options.topK,
+                                             rankBy=options.rankBy)
+        ruleCount = len(rules)
+    else:
+        # itemsets and rules are written as soon as they are produced
+        writer = openResultWriter(options.output, options.format,
+                                  ('confidence',))
+        for key, value in largeSet.items():
+            for item in value:
+                writer.writeItem(item, float(freqSet[item])/transactionCount)
+        rules = generateRules(largeSet, freqSet, transactionCount,
+                              minConfidence, topK=options.topK,
+                              rankBy=options.rankBy, onRule=writer.writeRule)
+        for rule in rules:
+            writer.writeRule(rule)
+        writer.close()
+        ruleCount = writer.ruleCount
+
+    if options.profile is not None:
+        with open(options.profile, 'w') as f:
+            json.dump({'input': options.input,
+                       'minSupport': minSupport,
+                       'algorithm': options.algorithm,
+                       'counting': options.counting,
+                       'mode': options.mode,
+                       'transactions': transactionCount,
+                       'frequentItemSets': sum(map(len, largeSet.values())),
+                       'rules': ruleCount,
+                       'miningTime': miningTime,
+                       'peakMemoryKB': peakMemoryKB(),
+                       'levels': levels}, f, indent=2)
+
+    if options.format == 'text':
+        out = sys.stdout if options.output is None else open(options.output, 'w')
+        printResults(items, rules, out)
+        if out is not sys.stdout:
+            out.close()
@@ -8,11 +8,25 @@ Usage:
 """
 
 import sys
+import json
+import time
 
-from itertools import chain, combinations
+from itertools import chain, combinations, count as counter
 from collections import defaultdict
+from heapq import heappush, heapreplace
+from multiprocessing import Pool
 from optparse import OptionParser
 
+from counting import (returnItemsWithMinSupportWeighted,
+                      returnItemsWithMinSupportVertical, joinSet,
+                      getItemSetTransactionList, makeItemFilter,
+                      getMissingSubsets, levelStats, peakMemoryKB,
+                      getFrequentItemSetsStore)
+from fpgrowth import findFrequentItemSets
+from transaction_store import TransactionStore
+from itemset_cache import ItemSetCache
+from result_writer import openResultWriter
+
 
 def subsets(arr):
     """ Returns non empty subsets of arr"""
@@ -42,72 +56,206 @@ def returnItemsWithMinSupport(itemSet, transactionList, minSupport, freqSet):
         return _itemSet
 
 
-def joinSet(itemSet, length):
-        """Join a set with itself and returns the n-element itemsets"""
-        return set([i.union(j) for i in itemSet for j in itemSet if len(i.union(j)) == length])
+# transactions of the current worker process (see initCountWorker)
+workerTransactions = None
 
 
-def getItemSetTransactionList(data_iterator):
-    transactionList = list()
-    itemSet = set()
-    for record in data_iterator:
-        transaction = frozenset(record)
-        transactionList.append(transaction)
-        for item in transaction:
-            # 全アイテムリストを作成（重複無し）
-            itemSet.add(frozenset([item]))              # Generate 1-itemSets
-    return itemSet, transactionList
+def initCountWorker(transactionList):
+        """Pool initializer, keeps the transaction list in the worker process"""
+        global workerTransactions
+        workerTransactions = transactionList
 
 
-### modified ###
-# def runApriori(data_iter, minSupport, minConfidence):
-def runApriori(data_iter, minSupport, minConfidence,minLift):
+def countPartition(task):
+        """counts the candidates of itemSet in the partition [start:end) of
+       the worker's transaction list and returns the local counts"""
+        itemSet, start, end = task
+        localSet = defaultdict(int)
+
+        for transaction in workerTransactions[start:end]:
+                for item in itemSet:
+                        if item.issubset(transaction):
+                                localSet[item] += 1
+
+        return localSet
+
+
+def returnItemsWithMinSupportParallel(itemSet, transactionList, minSupport,
+                                      freqSet, pool, workers):
+        """Same as returnItemsWithMinSupport, but the transaction list is split
+       into one partition per worker of pool. The local counts of every
+       partition are merged before the minimum support test"""
+        _itemSet = set()
+        localSet = defaultdict(int)
+
+        # 各workerの担当範囲に分割する
+        size = -(-len(transactionList) // workers)
+        tasks = [(itemSet, start, start + size)
+                 for start in range(0, len(transactionList), size)]
+        for partialSet in pool.imap_unordered(countPartition, tasks):
+                for item, count in partialSet.items():
+                        localSet[item] += count
+
+        for item, count in localSet.items():
+                freqSet[item] += count
+                support = float(count)/len(transactionList)
+
+                if support >= minSupport:
+                        _itemSet.add(item)
+
+        return _itemSet
+
+
+def generateRules(largeSet, freqSet, transactionCount, minConfidence, minLift,
+                  topK=None, rankBy='lift', onRule=None):
     """
-    run the apriori algorithm. data_iter is a record iterator
-    Return both:
-     - items (tuple, support)
-     - rules ((pretuple, posttuple), confidence)
-     
-    ### added ###
-    lift = P(B|A)/P(B)
-         = P(A U B)/P(A)*P(B)
-         = conf(A => B)/sup(B)
+    Returns the association rules ((pretuple, posttuple), confidence, lift)
+    of the frequent itemSets in largeSet. The consequents of every itemSet are
+    grown one item at a time and only from consequents whose rule satisfies
+    minConfidence, since moving an item from the antecedent to the consequent
+    can only lower the confidence.
+    With topK, only the topK best rules ranked by rankBy ('confidence' or
+    'lift') are kept in a heap, and they are returned best first.
+    Otherwise, if onRule is given, every rule is passed to it as soon as it is
+    found instead of being returned
     """
-    itemSet, transactionList = getItemSetTransactionList(data_iter)
+    def getSupport(item):
+            """local function which Returns the support of an item"""
+            return float(freqSet[item])/transactionCount
 
-    freqSet = defaultdict(int)
-    largeSet = dict()
-    # Global dictionary which stores (key=n-itemSets,value=support)
-    # which satisfy minSupport
+    toRetRules = []
+    heap = []
+    order = counter()
+    for key, value in list(largeSet.items())[1:]:
+        for item in value:
+            itemSupport = getSupport(item)
+            consequents = set(frozenset([element]) for element in item)
+            length = 1
+            while consequents and length < len(item):
+                kept = set()
+                for remain in consequents:
+                    element = item.difference(remain)
+                    confidence = itemSupport/getSupport(element)
+                    if confidence < minConfidence:
+                        continue
+                    # lift = conf(A => B)/sup(B)
+                    lift = confidence / getSupport(remain)
+                    rule = ((tuple(element), tuple(remain)), confidence, lift)
+                    if lift < minLift:
+                        kept.add(remain)
+                        continue
+                    score = confidence if rankBy == 'confidence' else lift
+                    if topK is None:
+                        if onRule is None:
+                            toRetRules.append(rule)
+                        else:
+                            onRule(rule)
+                    elif len(heap) < topK:
+                        heappush(heap, (score, next(order), rule))
+                    elif heap and score > heap[0][0]:
+                        heapreplace(heap, (score, next(order), rule))
+                    elif rankBy == 'confidence':
+                        # larger consequents cannot beat the worst kept rule
+                        continue
+                    kept.add(remain)
+                length = length + 1
+                consequents = joinSet(kept, length)
+
+    if topK is not None:
+        toRetRules = [rule for score, i, rule in sorted(heap, reverse=True)]
+    return toRetRules
+
+
+def countItemSets(itemSet, transactions):
+    """Returns the number of transactions containing each item of itemSet"""
+    counts = defaultdict(int)
+    for transaction in transactions:
+        for item in itemSet:
+            if item.issubset(transaction):
+                counts[item] += 1
+    return counts
 
-    assocRules = dict()
-    # Dictionary which stores Association Rules
 
-    # 初回の調査
-    # itemSetの各要素は単一item
-    # minSupport以上の要素が返ってくる
-    oneCSet = returnItemsWithMinSupport(itemSet,
-                                        transactionList,
-                                        minSupport,
-                                        freqSet)
-
-    # minSupport以上の要素がなくなるまで要素の結合と探索を繰り返す
-    currentLSet = oneCSet
-    k = 2
-    while(currentLSet != set([])):
-        largeSet[k-1] = currentLSet
-        # 各要素の要素数が一つだけ大きくなるような集合を生成する
-        currentLSet = joinSet(currentLSet, k)
-        currentCSet = returnItemsWithMinSupport(currentLSet,
-                                                transactionList,
-                                                minSupport,
-                                                freqSet)
-        currentLSet = currentCSet
+def updateFrequentItemSets(mined, old_source, newTransactions, minSupport):
+    """
+    FUP: updates mined = (freqSet, largeSet, transactionCount), the frequent
+    itemsets of the old transactions, with a batch of new transactions.
+    Itemsets which were frequent only need to be counted in the new batch.
+    The other candidates are kept only if they could reach minSupport with
+    the largest count an infrequent itemset can have in the old transactions,
+    and only those are counted again over old_source(), a function returning
+    a fresh iterator over the old records
+    Return the updated (freqSet, largeSet, transactionCount)
+    """
+    oldFreqSet, oldLargeSet, oldCount = mined
+    newTransactions = [frozenset(record) for record in newTransactions]
+    transactionCount = oldCount + len(newTransactions)
+
+    def isFrequent(count):
+            """local function, same test as returnItemsWithMinSupport"""
+            return float(count)/transactionCount >= minSupport
+
+    # 旧データで頻出でなかった集合が取り得る最大の出現回数
+    maxOldCount = 0
+    if oldCount > 0:
+        maxOldCount = min(int(minSupport * oldCount), oldCount)
+        while maxOldCount > 0 and float(maxOldCount)/oldCount >= minSupport:
+            maxOldCount -= 1
+        while maxOldCount < oldCount and \
+                float(maxOldCount + 1)/oldCount < minSupport:
+            maxOldCount += 1
+
+    freqSet = dict()
+    largeSet = dict()
+    candidates = set(oldLargeSet.get(1, ()))
+    for transaction in newTransactions:
+        for item in transaction:
+            candidates.add(frozenset([item]))
+
+    k = 1
+    while candidates:
+        oldFrequent = oldLargeSet.get(k, set())
+        newCounts = countItemSets(candidates, newTransactions)
+        currentLSet = set()
+        promoted = set()
+        for item in candidates:
+            if item in oldFrequent:
+                count = oldFreqSet[item] + newCounts[item]
+                if isFrequent(count):
+                    freqSet[item] = count
+                    currentLSet.add(item)
+            elif isFrequent(maxOldCount + newCounts[item]):
+                promoted.add(item)
+
+        # 新たに頻出となり得る集合のみ旧データを再走査する
+        if promoted:
+            oldCounts = countItemSets(promoted,
+                                      (frozenset(record)
+                                       for record in old_source()))
+            for item in promoted:
+                count = oldCounts[item] + newCounts[item]
+                if isFrequent(count):
+                    freqSet[item] = count
+                    currentLSet.add(item)
+
+        if not currentLSet:
+            break
+        largeSet[k] = currentLSet
         k = k + 1
+        candidates = joinSet(currentLSet, k)
 
+    return freqSet, largeSet, transactionCount
+
+
+def generateItemsAndRules(largeSet, freqSet, transactionCount, minConfidence, minLift,
+                          topK=None, rankBy='lift'):
+    """
+    Returns both the frequent items and the association rules built from the
+    frequent itemSets in largeSet and their support counts in freqSet
+    """
     def getSupport(item):
             """local function which Returns the support of an item"""
-            return float(freqSet[item])/len(transactionList)
+            return float(freqSet[item])/transactionCount
 
     # minSupport以上の組み合わせを列挙する
     toRetItems = []
@@ -116,45 +264,202 @@ def runApriori(data_iter, minSupport, minConfidence,minLift):
                            for item in value])
 
     # 相関(association)ルールを列挙する
-    toRetRules = []
-    print(largeSet.items())
-    for key, value in list(largeSet.items())[1:]:
-        for item in value:
-            _subsets = map(frozenset, [x for x in subsets(item)])
-            for element in _subsets:
-                ### added ###
-                # item = element U remain
-                remain = item.difference(element)
-                if len(remain) > 0:
-                    ### added ###
-                    # conf(A => B) = P(B | A) = sup(A U B)/sup(A)
-                    confidence = getSupport(item)/getSupport(element)
-                    ### added ###
-                    # lift = conf(A => B)/sup(B)
-                    lift = confidence / getSupport(remain)
-                    ### modified ###
-                    #if confidence >= minConfidence:
-                    if confidence >= minConfidence and lift >= minLift:
-                        toRetRules.append(((tuple(element), tuple(remain)),
-                                           confidence,lift))
+    toRetRules = generateRules(largeSet, freqSet, transactionCount,
+                               minConfidence, minLift, topK=topK, rankBy=rankBy)
     return toRetItems, toRetRules
 
 
-def printResults(items, rules):
-    """prints the generated itemsets sorted by support and the confidence rules sorted by confidence"""
+def getFrequentItemSets(data_iter, minSupport, counting='horizontal', workers=1,
+                        onLevel=None, maxLen=None, required=None,
+                        excluded=None, prefixes=None):
+    """
+    run the apriori levels. data_iter is a record iterator
+    Return:
+     - freqSet (key=itemSet, value=support count)
+     - largeSet (key=n, value=set of frequent n-itemSets)
+     - number of transactions
+    onLevel, if given, is called at the end of every level k with a dict of
+    its candidate and frequent counts, the time spent in joinSet and in
+    support counting, and the peak memory of the process
+    Constraints are pushed into the search: the excluded items and the items
+    not starting with one of prefixes are dropped when the transactions are
+    read, no candidate is generated beyond maxLen items, and with required
+    only the itemsets containing at least one of the required items are
+    generated (the subsets the rules need are counted at the end)
+    """
+    tidIndex = dict() if counting == 'vertical' else None
+    weights = list() if counting == 'weighted' else None
+    isAllowed = makeItemFilter(excluded, prefixes)
+    itemSet, transactionList = getItemSetTransactionList(data_iter, tidIndex,
+                                                         weights, isAllowed)
+    required = frozenset(required) if required else None
+    transactionCount = len(transactionList) if weights is None else sum(weights)
+
+    pool = None
+    if workers > 1 and counting == 'horizontal' and transactionList:
+        pool = Pool(workers, initCountWorker, (transactionList,))
+
+    freqSet = defaultdict(int)
+    largeSet = dict()
+    # Global dictionary which stores (key=n-itemSets,value=support)
+    # which satisfy minSupport
+
+    assocRules = dict()
+    # Dictionary which stores Association Rules
+
+    def countSupport(candidates):
+            """local function which counts candidates with the selected engine"""
+            if pool is not None:
+                    return returnItemsWithMinSupportParallel(candidates,
+                                                             transactionList,
+                                                             minSupport,
+                                                             freqSet,
+                                                             pool,
+                                                             workers)
+            if weights is not None:
+                    return returnItemsWithMinSupportWeighted(candidates,
+                                                             transactionList,
+                                                             weights,
+                                                             transactionCount,
+                                                             minSupport,
+                                                             freqSet)
+            if tidIndex is None:
+                    return returnItemsWithMinSupport(candidates,
+                                                     transactionList,
+                                                     minSupport,
+                                                     freqSet)
+            return returnItemsWithMinSupportVertical(candidates,
+                                                     tidIndex,
+                                                     len(transactionList),
+                                                     minSupport,
+                                                     freqSet)
+
+    try:
+        # 初回の調査
+        # itemSetの各要素は単一item
+        # minSupport以上の要素が返ってくる
+        start = time.time()
+        oneCSet = countSupport(itemSet)
+        if onLevel is not None:
+            onLevel(levelStats(1, itemSet, oneCSet, 0.0, time.time() - start))
+
+        # minSupport以上の要素がなくなるまで要素の結合と探索を繰り返す
+        currentLSet = oneCSet
+        k = 2
+        while(currentLSet != set([])):
+            largeSet[k-1] = currentLSet
+            # 各要素の要素数が一つだけ大きくなるような集合を生成する
+            start = time.time()
+            currentLSet = joinSet(currentLSet, k, maxLen, required)
+            joined = time.time()
+            currentCSet = countSupport(currentLSet)
+            if onLevel is not None:
+                onLevel(levelStats(k, currentLSet, currentCSet,
+                                   joined - start, time.time() - joined))
+            if required and k == 2:
+                # 結合には全ての1-itemSetが必要だったが，結果には必須アイテムを含むものだけ残す
+                largeSet[1] = set(item for item in largeSet[1]
+                                  if not item.isdisjoint(required))
+            if tidIndex is not None and k > 2:
+                # bitsets of the (k-1)-itemSets are no longer needed
+                for item in largeSet[k-1]:
+                    del tidIndex[item]
+            currentLSet = currentCSet
+            k = k + 1
+        if required:
+            # ルール生成に必要な，必須アイテムを含まない部分集合を数える
+            countSupport(getMissingSubsets(largeSet, freqSet))
+    finally:
+        # 例外 (不正なレコードやKeyboardInterrupt) でもworkerプロセスを残さない
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    return freqSet, largeSet, transactionCount
+
+
+### modified ###
+# def runApriori(data_iter, minSupport, minConfidence):
+def runApriori(data_iter, minSupport, minConfidence,minLift,counting='horizontal',
+               workers=1, topK=None, rankBy='lift', onLevel=None, maxLen=None,
+               required=None, excluded=None, prefixes=None):
+    """
+    run the apriori algorithm. data_iter is a record iterator
+    Return both:
+     - items (tuple, support)
+     - rules ((pretuple, posttuple), confidence)
+     
+    ### added ###
+    lift = P(B|A)/P(B)
+         = P(A U B)/P(A)*P(B)
+         = conf(A => B)/sup(B)
+
+    counting selects the support counting engine: 'horizontal' scans every
+    transaction, 'vertical' intersects tid bitsets, 'weighted' scans every
+    distinct basket once, weighted by its number of occurrences
+    with workers > 1, horizontal counting is split across a process pool
+    topK and rankBy are passed to generateRules
+    onLevel is the per-level hook of getFrequentItemSets
+    maxLen, required, excluded and prefixes are the constraints pushed into
+    the search (see getFrequentItemSets)
+    """
+    freqSet, largeSet, transactionCount = getFrequentItemSets(data_iter,
+                                                              minSupport,
+                                                              counting,
+                                                              workers,
+                                                              onLevel,
+                                                              maxLen,
+                                                              required,
+                                                              excluded,
+                                                              prefixes)
+    return generateItemsAndRules(largeSet, freqSet, transactionCount,
+                                 minConfidence, minLift, topK=topK, rankBy=rankBy)
+
+
+def runAprioriStore(store, minSupport, minConfidence, minLift, chunkSize=100000,
+                    topK=None, rankBy='lift'):
+    """
+    same as runApriori, but mines the item ids of a TransactionStore and
+    streams its transactions chunk by chunk at every level, so that memory
+    stays bounded by chunkSize whatever the number of transactions
+    """
+    freqSet, largeSet, transactionCount = getFrequentItemSetsStore(store,
+                                                                   minSupport,
+                                                                   chunkSize)
+    return generateItemsAndRules(largeSet, freqSet, transactionCount,
+                                 minConfidence, minLift, topK=topK, rankBy=rankBy)
+
+
+def runFPGrowth(data_source, minSupport, minConfidence, minLift, topK=None,
+                rankBy='lift'):
+    """
+    same as runApriori, but mines the frequent itemsets with FP-Growth.
+    data_source is a function returning a fresh record iterator, it is
+    called once per pass over the data (two passes in total)
+    """
+    freqSet, largeSet, transactionCount = findFrequentItemSets(data_source,
+                                                               minSupport)
+    return generateItemsAndRules(largeSet, freqSet, transactionCount,
+                                 minConfidence, minLift, topK=topK, rankBy=rankBy)
+
+
+def printResults(items, rules, out=None):
+    """prints the generated itemsets sorted by support and the confidence rules sorted by confidence
+    to out (stdout by default)"""
+    out = sys.stdout if out is None else out
     item_list = sorted(items, key=lambda x: x[1])
     for item, support in item_list:
-        print("item: %s , %.3f" % (str(item), support))
-    print("\n------------------------ RULES:")
+        print("item: %s , %.3f" % (str(item), support), file=out)
+    print("\n------------------------ RULES:", file=out)
     rule_list = sorted(rules, key=lambda x: x[2])
     for rule, confidence,lift in rule_list:
         pre, post = rule
-        print("Rule: %s ==> %s , conf=%.3f, lift=%.3f" % (str(pre), str(post), confidence, lift))
+        print("Rule: %s ==> %s , conf=%.3f, lift=%.3f" % (str(pre), str(post), confidence, lift), file=out)
 
 
 def dataFromFile(fname):
         """Function which reads from the file and yields a generator"""
-        file_iter = open(fname, 'rU')
+        file_iter = open(fname, 'r')
         for line in file_iter:
                 line = line.strip().rstrip(',')                         # Remove trailing comma
                 record = frozenset(line.split(','))
@@ -186,6 +491,88 @@ if __name__ == "__main__":
                          default=1.0,
                          type='float')
 
+    optparser.add_option('--counting',
+                         dest='counting',
+                         help='support counting engine: horizontal, vertical or weighted',
+                         default='horizontal',
+                         type='choice',
+                         choices=['horizontal', 'vertical', 'weighted'])
+
+    optparser.add_option('-a', '--algorithm',
+                         dest='algorithm',
+                         help='mining algorithm: apriori or fpgrowth',
+                         default='apriori',
+                         type='choice',
+                         choices=['apriori', 'fpgrowth'])
+
+    optparser.add_option('-w', '--workers',
+                         dest='workers',
+                         help='number of processes used for horizontal support counting',
+                         default=1,
+                         type='int')
+    optparser.add_option('--store',
+                         dest='store',
+                         help='path of an on-disk transaction store, (re)built from the input if missing, incomplete or older than the input',
+                         default=None)
+    optparser.add_option('--chunkSize',
+                         dest='chunkSize',
+                         help='number of transactions streamed at once from the store',
+                         default=100000,
+                         type='int')
+
+    optparser.add_option('-t', '--topK', '--top',
+                         dest='topK',
+                         help='only keep the topK best rules',
+                         default=None,
+                         type='int')
+    optparser.add_option('-r', '--rankBy',
+                         dest='rankBy',
+                         help='rule ranking used by --topK: confidence or lift',
+                         default='lift',
+                         type='choice',
+                         choices=['confidence', 'lift'])
+
+    optparser.add_option('--append',
+                         dest='append',
+                         help='csv of new transactions appended to the input file, mined incrementally',
+                         default=None)
+    optparser.add_option('--cache',
+                         dest='cache',
+                         help='directory caching the frequent itemsets of the input file',
+                         default=None)
+
+    optparser.add_option('--max-len',
+                         dest='maxLen',
+                         help='maximum number of items of the itemsets',
+                         default=None,
+                         type='int')
+    optparser.add_option('--require',
+                         dest='required',
+                         help='comma separated items, every itemset must contain one of them',
+                         default=None)
+    optparser.add_option('--exclude',
+                         dest='excluded',
+                         help='comma separated items to ignore',
+                         default=None)
+    optparser.add_option('--prefix',
+                         dest='prefixes',
+                         help='comma separated prefixes, only the items starting with one of them are mined',
+                         default=None)
+    optparser.add_option('-o', '--output',
+                         dest='output',
+                         help='file the results are written to (stdout by default); text is sorted first, the other formats are streamed',
+                         default=None)
+    optparser.add_option('--format',
+                         dest='format',
+                         help='output format: text (sorted, as printResults), csv, jsonl or binary',
+                         default='text',
+                         type='choice',
+                         choices=['text', 'csv', 'jsonl', 'binary'])
+    optparser.add_option('--profile-json',
+                         dest='profile',
+                         help='write the per-level statistics of the run to this json file',
+                         default=None)
+
     (options, args) = optparser.parse_args()
 
     inFile = None
@@ -202,9 +589,103 @@ if __name__ == "__main__":
     ### added ###
     # lift値
     minLift = options.minL
+    required, excluded, prefixes = [None if value is None else value.split(',')
+                                    for value in (options.required,
+                                                  options.excluded,
+                                                  options.prefixes)]
+    constrained = any(value is not None for value in (options.maxLen, required,
+                                                      excluded, prefixes))
+    if constrained and (options.store is not None or
+                        options.algorithm == 'fpgrowth' or
+                        options.append is not None):
+        sys.exit('--max-len, --require, --exclude and --prefix are only '
+                 'supported by the in-memory apriori engines')
 
     ### modified ###
     # items, rules = runApriori(inFile, minSupport, minConfidence)
-    items, rules = runApriori(inFile, minSupport, minConfidence,minLift)
-
-    printResults(items, rules)
+    cache = None
+    mined = None
+    if options.cache is not None and options.input is not None \
+            and not constrained:
+        cache = ItemSetCache(options.cache)
+        mined = cache.load(options.input, minSupport)
+
+    levels = []
+    start = time.time()
+    if mined is None:
+        if options.store is not None:
+            # 入力が標準入力の場合は内容を確かめられないので毎回作り直す
+            if options.input is not None and \
+                    TransactionStore.exists(options.store, options.input):
+                store = TransactionStore(options.store)
+            else:
+                store = TransactionStore.build(inFile, options.store,
+                                               source=options.input)
+            mined = getFrequentItemSetsStore(store, minSupport, options.chunkSize)
+            store.close()
+        elif options.algorithm == 'fpgrowth':
+            if options.input is None:
+                records = list(inFile)
+                dataSource = lambda: iter(records)
+            else:
+                dataSource = lambda: dataFromFile(options.input)
+            mined = findFrequentItemSets(dataSource, minSupport)
+        else:
+            mined = getFrequentItemSets(inFile, minSupport, options.counting,
+                                        options.workers, onLevel=levels.append,
+                                        maxLen=options.maxLen,
+                                        required=required,
+                                        excluded=excluded,
+                                        prefixes=prefixes)
+        if cache is not None:
+            cache.save(options.input, minSupport, *mined)
+
+    if options.append is not None and options.input is not None:
+        mined = updateFrequentItemSets(mined,
+                                       lambda: dataFromFile(options.input),
+                                       dataFromFile(options.append),
+                                       minSupport)
+        if cache is not None:
+            # same key as the input file once the new transactions are appended
+            cache.save([options.input, options.append], minSupport, *mined)
+
+    freqSet, largeSet, transactionCount = mined
+    miningTime = time.time() - start
+    if options.format == 'text':
+        items, rules = generateItemsAndRules(largeSet, freqSet, transactionCount,
+                                             minConfidence, minLift, topK=options.topK,
+                                             rankBy=options.rankBy)
+        ruleCount = len(rules)
+    else:
+        # itemsets and rules are written as soon as they are produced
+        writer = openResultWriter(options.output, options.format,
+                                  ('confidence', 'lift'))
+        for key, value in largeSet.items():
+            for item in value:
+                writer.writeItem(item, float(freqSet[item])/transactionCount)
+        rules = generateRules(largeSet, freqSet, transactionCount,
+                              minConfidence, minLift, topK=options.topK,
+                              rankBy=options.rankBy, onRule=writer.writeRule)
+        for rule in rules:
+            writer.writeRule(rule)
+        writer.close()
+        ruleCount = writer.ruleCount
+
+    if options.profile is not None:
+        with open(options.profile, 'w') as f:
+            json.dump({'input': options.input,
+                       'minSupport': minSupport,
+                       'algorithm': options.algorithm,
+                       'counting': options.counting,
+                       'transactions': transactionCount,
+                       'frequentItemSets': sum(map(len, largeSet.values())),
+                       'rules': ruleCount,
+                       'miningTime': miningTime,
+                       'peakMemoryKB': peakMemoryKB(),
+                       'levels': levels}, f, indent=2)
+
+    if options.format == 'text':
+        out = sys.stdout if options.output is None else open(options.output, 'w')
+        printResults(items, rules, out)
+        if out is not sys.stdout:
+            out.close()
@@ -0,0 +1,242 @@
+"""
+Description     : Benchmark of the Apriori miners on synthetic basket data
+
+Generates Quest-style synthetic transactions (Agrawal & Srikant) and runs
+runApriori (apriori_modify.py) and runApriori_neg (no5/task/task5_modified.py)
+over a grid of dataset sizes and support thresholds. Every run is done in a
+fresh process and reported as one JSON line with its wall time, peak RSS and
+the per-level statistics of the onLevel hook of the miners.
+
+Usage:
+    $python benchmark.py -d 1000,10000 -s 0.05,0.02,0.01 -o bench.jsonl
+
+    $python benchmark.py --generate basket.csv -d 100000 -t 10 -n 1000 -i 4
+"""
+
+import os
+import sys
+import json
+import time
+import math
+import random
+import shutil
+import tempfile
+import contextlib
+import multiprocessing
+from optparse import OptionParser
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'no5', 'task'))
+
+import apriori_modify
+import task5_modified
+from counting import peakMemoryKB
+
+
+def poisson(rng, mean):
+    """Returns a Poisson distributed integer (Knuth)"""
+    limit = math.exp(-mean)
+    count = 0
+    product = rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def generatePatterns(rng, numItems, patternLength, numPatterns,
+                     correlation=0.5, corruptionMean=0.5):
+    """
+    Returns the potentially frequent itemsets as (items, weight, corruption).
+    Each pattern shares an exponentially distributed fraction of its items
+    with the previous one, the rest being picked at random
+    """
+    patterns = []
+    previous = []
+    for i in range(numPatterns):
+        size = max(1, poisson(rng, patternLength))
+        shared = min(len(previous), size,
+                     int(round(rng.expovariate(1.0 / correlation) * size)))
+        items = set(rng.sample(previous, shared)) if shared else set()
+        while len(items) < min(size, numItems):
+            items.add(rng.randrange(numItems))
+        corruption = min(1.0, max(0.0, rng.gauss(corruptionMean, 0.1)))
+        patterns.append((sorted(items), rng.expovariate(1.0), corruption))
+        previous = list(items)
+
+    total = sum(weight for items, weight, corruption in patterns)
+    return [(items, weight / total, corruption)
+            for items, weight, corruption in patterns]
+
+
+def generateTransactions(numTransactions, avgLength, numItems, patternLength,
+                         numPatterns=None, seed=0):
+    """
+    Quest-style synthetic basket generator, yields the transactions as lists
+    of item names. Each transaction gets a Poisson(avgLength) size and is
+    filled with patterns drawn by weight, dropping items of a pattern while a
+    uniform draw stays below its corruption level
+    """
+    rng = random.Random(seed)
+    if numPatterns is None:
+        numPatterns = max(1, numItems // 2)
+    patterns = generatePatterns(rng, numItems, patternLength, numPatterns)
+    weights = [weight for items, weight, corruption in patterns]
+
+    pending = None
+    for i in range(numTransactions):
+        size = min(max(1, poisson(rng, avgLength)), numItems)
+        transaction = set()
+        while len(transaction) < size:
+            if pending is None:
+                items, weight, corruption = rng.choices(patterns, weights)[0]
+                items = list(items)
+                while items and rng.random() < corruption:
+                    items.pop(rng.randrange(len(items)))
+                pending = items
+            # a pattern which does not fit is kept for the next transaction
+            # half of the time
+            if transaction and len(transaction) + len(pending) > size \
+                    and rng.random() < 0.5:
+                break
+            transaction.update(pending)
+            pending = None
+        yield ['item%d' % item for item in sorted(transaction)]
+
+
+def writeTransactions(fname, transactions):
+    """writes transactions in the csv format read by dataFromFile"""
+    with open(fname, 'w') as f:
+        for transaction in transactions:
+            f.write(','.join(transaction) + '\n')
+
+
+def runOne(task):
+    """Runs one miner on one dataset, in a fresh worker process"""
+    levels = []
+    start = time.time()
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        if task['miner'] == 'runApriori':
+            items, rules = apriori_modify.runApriori(
+                apriori_modify.dataFromFile(task['file']),
+                task['minSupport'], task['minConfidence'], task['minLift'],
+                counting=task['counting'], onLevel=levels.append)
+        else:
+            items, rules = task5_modified.runApriori_neg(
+                task5_modified.dataFromFile(task['file']),
+                task['minSupport'], task['maxKul'], onLevel=levels.append,
+                counting=task['counting'])
+    wallTime = time.time() - start
+
+    report = dict((key, value) for key, value in task.items()
+                  if key != 'file')
+    report.update({'wallTime': wallTime,
+                   'peakRssKB': peakMemoryKB(),
+                   'levels': levels,
+                   'itemsets': len(items),
+                   'rules': len(rules)})
+    return report
+
+
+def runBenchmark(sizes, supports, miners, avgLength, numItems, patternLength,
+                 minConfidence=0.5, minLift=1.0, maxKul=0.1,
+                 counting='horizontal', seed=0, out=sys.stdout):
+    """Runs every miner for every (size, support) pair and writes one JSON
+    line per run to out. Returns the reports"""
+    workdir = tempfile.mkdtemp(prefix='apriori_bench_')
+    context = multiprocessing.get_context('spawn')
+    reports = []
+    try:
+        for size in sizes:
+            fname = os.path.join(workdir, 'quest_%d.csv' % size)
+            writeTransactions(fname, generateTransactions(
+                size, avgLength, numItems, patternLength, seed=seed))
+            for minSupport in supports:
+                for miner in miners:
+                    task = {'miner': miner, 'file': fname,
+                            'transactions': size, 'avgLength': avgLength,
+                            'numItems': numItems,
+                            'patternLength': patternLength,
+                            'minSupport': minSupport,
+                            'minConfidence': minConfidence,
+                            'minLift': minLift, 'maxKul': maxKul,
+                            'counting': counting, 'seed': seed}
+                    # one process per run so that peak RSS is per run
+                    with context.Pool(1, maxtasksperchild=1) as pool:
+                        report = pool.apply(runOne, (task,))
+                    out.write(json.dumps(report) + '\n')
+                    out.flush()
+                    reports.append(report)
+    finally:
+        shutil.rmtree(workdir)
+    return reports
+
+
+if __name__ == '__main__':
+
+    optparser = OptionParser()
+    optparser.add_option('-d', '--transactions',
+                         dest='sizes',
+                         help='comma separated numbers of transactions',
+                         default='1000,10000')
+    optparser.add_option('-s', '--minSupport',
+                         dest='supports',
+                         help='comma separated minimum support values',
+                         default='0.05,0.02')
+    optparser.add_option('-t', '--avgLength',
+                         dest='avgLength',
+                         help='average number of items per transaction',
+                         default=10,
+                         type='float')
+    optparser.add_option('-n', '--items',
+                         dest='numItems',
+                         help='number of distinct items',
+                         default=1000,
+                         type='int')
+    optparser.add_option('-i', '--patternLength',
+                         dest='patternLength',
+                         help='average length of the frequent patterns',
+                         default=4,
+                         type='float')
+    optparser.add_option('-m', '--miners',
+                         dest='miners',
+                         help='comma separated miners: runApriori,runApriori_neg',
+                         default='runApriori,runApriori_neg')
+    optparser.add_option('--counting',
+                         dest='counting',
+                         help='support counting engine (runApriori_neg counts vertical as horizontal)',
+                         default='horizontal',
+                         type='choice',
+                         choices=['horizontal', 'vertical', 'weighted'])
+    optparser.add_option('--seed',
+                         dest='seed',
+                         help='seed of the generator',
+                         default=0,
+                         type='int')
+    optparser.add_option('-o', '--output',
+                         dest='output',
+                         help='JSON lines report file (stdout by default)',
+                         default=None)
+    optparser.add_option('--generate',
+                         dest='generate',
+                         help='only write the synthetic transactions of the first size to this csv',
+                         default=None)
+    (options, args) = optparser.parse_args()
+
+    sizes = [int(size) for size in options.sizes.split(',')]
+    supports = [float(support) for support in options.supports.split(',')]
+    miners = options.miners.split(',')
+
+    if options.generate is not None:
+        writeTransactions(options.generate, generateTransactions(
+            sizes[0], options.avgLength, options.numItems,
+            options.patternLength, seed=options.seed))
+        sys.exit()
+
+    out = sys.stdout if options.output is None else open(options.output, 'w')
+    runBenchmark(sizes, supports, miners, options.avgLength,
+                 options.numItems, options.patternLength,
+                 counting=options.counting, seed=options.seed, out=out)
+    if out is not sys.stdout:
+        out.close()
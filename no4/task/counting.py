@@ -0,0 +1,282 @@
+"""
+Description     : Support counting engines used by apriori.py / apriori_modify.py
+                  and no5/task/task5_modified.py
+
+Builds the 1-itemSets and the transaction list (optionally a vertical tid
+bitset index, collapsed duplicate baskets and item filters), generates the
+candidates of the next level by prefix join, and counts their support either
+horizontally over weighted baskets, vertically by intersecting tid bitsets,
+or chunk by chunk over an out-of-core TransactionStore.
+"""
+
+import sys
+
+from itertools import chain, combinations
+from collections import defaultdict
+from math import comb
+
+try:
+    import resource
+except ImportError:                                     # not available on Windows
+    resource = None
+
+
+def returnItemsWithMinSupportWeighted(itemSet, transactionList, weights,
+                                      transactionCount, minSupport, freqSet):
+        """Same as returnItemsWithMinSupport, but transactionList only holds
+        distinct baskets, each one counting for its weight"""
+        _itemSet = set()
+        localSet = defaultdict(int)
+
+        for item in itemSet:
+                for transaction, weight in zip(transactionList, weights):
+                        if item.issubset(transaction):
+                                freqSet[item] += weight
+                                localSet[item] += weight
+
+        for item, count in localSet.items():
+                support = float(count)/transactionCount
+
+                if support >= minSupport:
+                        _itemSet.add(item)
+
+        return _itemSet
+
+
+def tidListToBitset(tids):
+    """Packs a sorted list of transaction ids into an int used as a bitset"""
+    bits = bytearray(tids[-1] // 8 + 1)
+    for tid in tids:
+        bits[tid >> 3] |= 1 << (tid & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def itemBitset(item, tidIndex):
+    """Returns the tid bitset of item, intersecting the cached bitset of one of
+    its (k-1)-subsets with a 1-itemSet whenever possible"""
+    if item in tidIndex:
+        return tidIndex[item]
+    elements = iter(item)
+    last = frozenset([next(elements)])
+    parent = item.difference(last)
+    if parent in tidIndex:
+        return tidIndex[parent] & tidIndex[last]
+    bits = tidIndex[last]
+    for element in elements:
+        bits &= tidIndex[frozenset([element])]
+    return bits
+
+
+def returnItemsWithMinSupportVertical(itemSet, tidIndex, transactionCount,
+                                      minSupport, freqSet):
+    """Same as returnItemsWithMinSupport, but counts the support of each item
+    by intersecting the tid bitsets of the vertical index instead of scanning
+    every transaction. The bitsets of the returned items are cached in tidIndex
+    so that the next level only needs a single intersection per candidate"""
+    _itemSet = set()
+
+    for item in itemSet:
+        bits = itemBitset(item, tidIndex)
+        count = bin(bits).count('1')
+        if count == 0:
+            continue
+        freqSet[item] += count
+
+        support = float(count)/transactionCount
+        if support >= minSupport:
+            _itemSet.add(item)
+            tidIndex[item] = bits
+
+    return _itemSet
+
+
+def returnItemsWithMinSupportStore(itemSet, store, minSupport, freqSet,
+                                   chunkSize):
+    """Same as returnItemsWithMinSupport, but itemSet holds n-itemsets of item
+    ids and the transactions are streamed from a TransactionStore chunk by
+    chunk. Each transaction either enumerates its own n-subsets or is tested
+    against every candidate, whichever is cheaper"""
+    _itemSet = set()
+    localSet = defaultdict(int)
+    if not itemSet:
+        return _itemSet
+
+    candidates = dict((tuple(sorted(item)), item) for item in itemSet)
+    length = len(next(iter(itemSet)))
+    candidateItems = set(chain(*itemSet))
+
+    for chunk in store.chunks(chunkSize):
+        for transaction in chunk:
+            present = sorted(candidateItems.intersection(transaction))
+            if len(present) < length:
+                continue
+            if comb(len(present), length) <= len(candidates):
+                for subset in combinations(present, length):
+                    item = candidates.get(subset)
+                    if item is not None:
+                        localSet[item] += 1
+            else:
+                present = frozenset(present)
+                for item in itemSet:
+                    if item.issubset(present):
+                        localSet[item] += 1
+
+    for item, count in localSet.items():
+        freqSet[item] += count
+        support = float(count)/len(store)
+
+        if support >= minSupport:
+            _itemSet.add(item)
+
+    return _itemSet
+
+
+def joinSet(itemSet, length, maxLen=None, required=None):
+        """Join a set with itself and returns the n-element itemsets.
+       Only itemsets sharing the same sorted (n-2)-prefix are joined, and
+       candidates with a (n-1)-subset missing from itemSet are pruned since
+       they cannot satisfy the minimum support (downward closure)
+       Nothing is returned beyond maxLen elements. With required, only the
+       candidates containing a required item are returned: the required
+       items are sorted first, so that for n > 2 both joined itemsets
+       contain one too, and the subsets without any are not checked"""
+        if maxLen is not None and length > maxLen:
+                return set()
+        key = None
+        if required:
+                key = lambda element: (element not in required, element)
+        prefixes = defaultdict(list)
+        for item in itemSet:
+                elements = tuple(sorted(item, key=key))
+                prefixes[elements[:length - 2]].append(elements[-1])
+
+        _itemSet = set()
+        for prefix, lasts in prefixes.items():
+                lasts.sort(key=key)
+                for i, first in enumerate(lasts):
+                        for second in lasts[i + 1:]:
+                                candidate = frozenset(prefix + (first, second))
+                                if required and candidate.isdisjoint(required):
+                                        continue
+                                if all(subset in itemSet
+                                       for subset in (candidate.difference([element])
+                                                      for element in prefix)
+                                       if not required or
+                                       not subset.isdisjoint(required)):
+                                        _itemSet.add(candidate)
+        return _itemSet
+
+
+def getItemSetTransactionList(data_iterator, tidIndex=None, weights=None,
+                              isAllowed=None):
+    """Returns the 1-itemSets and the transaction list. If tidIndex is given,
+    it is filled with a vertical index mapping each 1-itemSet to the bitset
+    (bit i set <=> transaction i contains it) of the transactions containing it.
+    If weights (a list) is given, identical transactions are collapsed: the
+    transaction list only holds distinct baskets, and weights receives the
+    number of occurrences of each of them.
+    If isAllowed is given, the items for which it is false are dropped from
+    the transactions as they are read"""
+    transactionList = list()
+    itemSet = set()
+    tidLists = defaultdict(list)
+    basketIds = dict()
+    for record in data_iterator:
+        transaction = frozenset(record)
+        if isAllowed is not None:
+            transaction = frozenset(item for item in transaction
+                                    if isAllowed(item))
+        if weights is not None:
+            basketId = basketIds.get(transaction)
+            if basketId is not None:
+                weights[basketId] += 1
+                continue
+            basketIds[transaction] = len(transactionList)
+            weights.append(1)
+        if tidIndex is not None:
+            for item in transaction:
+                tidLists[item].append(len(transactionList))
+        transactionList.append(transaction)
+        for item in transaction:
+            itemSet.add(frozenset([item]))              # Generate 1-itemSets
+    if tidIndex is not None:
+        for item, tids in tidLists.items():
+            tidIndex[frozenset([item])] = tidListToBitset(tids)
+    return itemSet, transactionList
+
+
+def makeItemFilter(excluded=None, prefixes=None):
+    """Returns a function telling whether an item is neither excluded nor
+    outside of the item prefixes, or None if every item is allowed"""
+    if not excluded and not prefixes:
+        return None
+    excluded = frozenset(excluded or ())
+    prefixes = tuple(prefixes or ())
+
+    def isAllowed(item):
+            """local function, True if item passes the filters"""
+            if item in excluded:
+                    return False
+            return not prefixes or item.startswith(prefixes)
+    return isAllowed
+
+
+def getMissingSubsets(largeSet, freqSet):
+    """Returns the proper subsets of the itemSets of largeSet which are not
+    counted in freqSet. They are the subsets without any required item,
+    whose support counts generateRules still needs"""
+    missing = set()
+    for key, value in largeSet.items():
+        for item in value:
+            for length in range(1, len(item)):
+                for subset in combinations(item, length):
+                    subset = frozenset(subset)
+                    if subset not in freqSet:
+                        missing.add(subset)
+    return missing
+
+
+def peakMemoryKB():
+    """Returns the peak resident set size of the process in KB, or None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def levelStats(k, candidates, frequent, joinTime, countTime):
+    """Returns the statistics of level k passed to the onLevel hook"""
+    return {'k': k,
+            'candidates': len(candidates),
+            'frequent': len(frequent),
+            'joinTime': joinTime,
+            'countTime': countTime,
+            'peakMemoryKB': peakMemoryKB()}
+
+
+def getFrequentItemSetsStore(store, minSupport, chunkSize=100000):
+    """
+    same as getFrequentItemSets of the scripts, but mines the item ids of a
+    TransactionStore and streams its transactions chunk by chunk at every level
+    """
+    freqSet = defaultdict(int)
+    largeSet = dict()
+
+    itemSet = set(frozenset([itemId]) for itemId in range(len(store.items)))
+    currentLSet = returnItemsWithMinSupportStore(itemSet, store, minSupport,
+                                                 freqSet, chunkSize)
+    k = 2
+    while(currentLSet != set([])):
+        largeSet[k-1] = currentLSet
+        currentLSet = joinSet(currentLSet, k)
+        currentLSet = returnItemsWithMinSupportStore(currentLSet, store,
+                                                     minSupport, freqSet,
+                                                     chunkSize)
+        k = k + 1
+
+    # item ids -> item strings
+    freqSet = dict((store.decode(item), count)
+                   for item, count in freqSet.items())
+    largeSet = dict((key, set(map(store.decode, value)))
+                    for key, value in largeSet.items())
+    return freqSet, largeSet, len(store)
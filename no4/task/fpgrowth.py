@@ -0,0 +1,126 @@
+"""
+Description     : FP-Growth miner used by apriori.py / apriori_modify.py
+
+Finds the same frequent itemsets as runApriori with exactly two passes over
+the input: the first one counts the 1-itemSets, the second one inserts every
+transaction into an FP-tree. The itemsets are then mined from the tree by
+recursively building conditional FP-trees, without any candidate generation.
+"""
+
+from collections import defaultdict
+
+
+class FPNode(object):
+    """A node of an FP-tree"""
+    __slots__ = ('item', 'count', 'parent', 'children')
+
+    def __init__(self, item, parent):
+        self.item = item
+        self.count = 0
+        self.parent = parent
+        self.children = dict()
+
+
+class FPTree(object):
+    """FP-tree with a header table linking every node of the same item"""
+
+    def __init__(self):
+        self.root = FPNode(None, None)
+        self.header = defaultdict(list)
+
+    def add(self, path, count):
+        """inserts path (items already sorted by descending frequency)"""
+        node = self.root
+        for item in path:
+            child = node.children.get(item)
+            if child is None:
+                child = FPNode(item, node)
+                node.children[item] = child
+                self.header[item].append(child)
+            child.count += count
+            node = child
+
+    def prefixPaths(self, item):
+        """Returns the conditional pattern base of item as (path, count)"""
+        paths = []
+        for node in self.header[item]:
+            path = []
+            parent = node.parent
+            while parent.item is not None:
+                path.append(parent.item)
+                parent = parent.parent
+            if path:
+                path.reverse()
+                paths.append((path, node.count))
+        return paths
+
+
+def buildTree(paths, isFrequent):
+    """Builds an FP-tree from (path, count) pairs keeping frequent items only.
+    Returns the tree and the support count of each kept item"""
+    counts = defaultdict(int)
+    for path, count in paths:
+        for item in path:
+            counts[item] += count
+    counts = dict((item, count) for item, count in counts.items()
+                  if isFrequent(count))
+
+    tree = FPTree()
+    for path, count in paths:
+        path = [item for item in path if item in counts]
+        path.sort(key=lambda item: (-counts[item], item))
+        if path:
+            tree.add(path, count)
+    return tree, counts
+
+
+def mineTree(tree, counts, suffix, isFrequent, freqSet):
+    """FP-Growth: records every frequent itemset ending with suffix"""
+    for item in sorted(counts, key=lambda item: (counts[item], item)):
+        itemSet = suffix.union([item])
+        freqSet[itemSet] = counts[item]
+        subTree, subCounts = buildTree(tree.prefixPaths(item), isFrequent)
+        if subCounts:
+            mineTree(subTree, subCounts, itemSet, isFrequent, freqSet)
+
+
+def findFrequentItemSets(data_source, minSupport):
+    """
+    run FP-Growth. data_source is a function returning a fresh record
+    iterator, it is called exactly twice (one call per pass)
+    Return:
+     - freqSet (key=itemSet, value=support count)
+     - largeSet (key=n, value=set of frequent n-itemSets)
+     - number of transactions
+    """
+    # 1st pass: support count of each item
+    itemCounts = defaultdict(int)
+    transactionCount = 0
+    for record in data_source():
+        transactionCount += 1
+        for item in frozenset(record):
+            itemCounts[item] += 1
+
+    def isFrequent(count):
+            """local function, same test as returnItemsWithMinSupport"""
+            return float(count)/transactionCount >= minSupport
+
+    counts = dict((item, count) for item, count in itemCounts.items()
+                  if isFrequent(count))
+
+    # 2nd pass: insert every transaction into the FP-tree
+    tree = FPTree()
+    for record in data_source():
+        path = [item for item in frozenset(record) if item in counts]
+        path.sort(key=lambda item: (-counts[item], item))
+        if path:
+            tree.add(path, 1)
+
+    freqSet = dict()
+    mineTree(tree, counts, frozenset(), isFrequent, freqSet)
+
+    largeSet = dict()
+    for item in freqSet:
+        largeSet.setdefault(len(item), set()).add(item)
+    largeSet = dict(sorted(largeSet.items()))
+    return freqSet, largeSet, transactionCount
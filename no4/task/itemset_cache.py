@@ -0,0 +1,111 @@
+"""
+Description     : Persistent cache of mined frequent itemsets
+
+The frequent itemsets found in a dataset are saved with their support counts,
+keyed by the SHA-256 of the dataset content and by minSupport. Any later run
+on the same content with an equal or higher minSupport is answered from the
+cache (downward closure: its frequent itemsets are a subset of the cached
+ones), so changing rule parameters such as -c, -l or -k does not remine.
+
+Usage:
+    cache = ItemSetCache('.apriori_cache')
+    cache.getSupport('groceries.csv', ['whole milk', 'yogurt'])
+"""
+
+import os
+import pickle
+import hashlib
+
+
+class ItemSetCache(object):
+    """Frequent itemsets of datasets, stored as pickles in cacheDir"""
+
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+        self._hashes = dict()
+        self._loaded = dict()
+
+    def fileHash(self, fname):
+        """Returns the SHA-256 of the content of fname. fname may also be a
+        list of files, hashed as if they were concatenated"""
+        fnames = (fname,) if isinstance(fname, str) else tuple(fname)
+        if fnames not in self._hashes:
+            digest = hashlib.sha256()
+            for name in fnames:
+                with open(name, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(block)
+            self._hashes[fnames] = digest.hexdigest()
+        return self._hashes[fnames]
+
+    def _entries(self, fname):
+        """Returns (minSupport, path) of the cache entries of fname"""
+        if not os.path.isdir(self.cacheDir):
+            return []
+        prefix = self.fileHash(fname) + '_'
+        entries = []
+        for name in os.listdir(self.cacheDir):
+            if name.startswith(prefix) and name.endswith('.pickle'):
+                minSupport = float(name[len(prefix):-len('.pickle')])
+                entries.append((minSupport, os.path.join(self.cacheDir, name)))
+        return entries
+
+    def _read(self, path):
+        if path not in self._loaded:
+            with open(path, 'rb') as f:
+                self._loaded[path] = pickle.load(f)
+        return self._loaded[path]
+
+    def save(self, fname, minSupport, freqSet, largeSet, transactionCount):
+        """Saves the frequent itemsets of largeSet and their counts in freqSet
+        (fname may be a list of files, see fileHash)"""
+        if not os.path.isdir(self.cacheDir):
+            os.makedirs(self.cacheDir)
+        entry = {
+            'minSupport': minSupport,
+            'transactionCount': transactionCount,
+            'freqSet': dict((item, freqSet[item])
+                            for value in largeSet.values() for item in value),
+        }
+        path = os.path.join(self.cacheDir, '%s_%r.pickle'
+                            % (self.fileHash(fname), minSupport))
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def load(self, fname, minSupport):
+        """
+        Returns (freqSet, largeSet, transactionCount) for minSupport from the
+        closest entry mined with a lower or equal minSupport, or None
+        """
+        entries = [entry for entry in self._entries(fname)
+                   if entry[0] <= minSupport]
+        if not entries:
+            return None
+        entry = self._read(max(entries)[1])
+
+        transactionCount = entry['transactionCount']
+        freqSet = dict()
+        largeSet = dict()
+        for item, count in entry['freqSet'].items():
+            # same test as returnItemsWithMinSupport
+            if float(count)/transactionCount >= minSupport:
+                freqSet[item] = count
+                largeSet.setdefault(len(item), set()).add(item)
+        largeSet = dict(sorted(largeSet.items()))
+        return freqSet, largeSet, transactionCount
+
+    def getSupport(self, fname, itemSet):
+        """
+        Returns the support of itemSet in fname, looked up in the entry with
+        the lowest minSupport. Returns None if nothing is cached for fname or
+        if itemSet is not frequent, i.e. its support is below that minSupport
+        """
+        entries = self._entries(fname)
+        if not entries:
+            return None
+        entry = self._read(min(entries)[1])
+        count = entry['freqSet'].get(frozenset(itemSet))
+        if count is None:
+            return None
+        return float(count)/entry['transactionCount']
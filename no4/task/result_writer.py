@@ -0,0 +1,158 @@
+"""
+Description     : Streaming writers for the mined itemsets and rules
+
+Unlike printResults, which sorts everything before printing it, the writers
+output every itemset and rule as soon as it is produced:
+    csv       one row per itemset / rule
+    jsonl     one JSON object per line
+    binary    length-prefixed records with dictionary-encoded items, read
+              back with readBinaryResults
+
+Rules are the tuples of the miners: ((pretuple, posttuple), metric, ...),
+the names of the metrics being given to openResultWriter.
+"""
+
+import sys
+import csv
+import json
+import struct
+
+MAGIC = b'APRR\x01'
+
+
+class ResultWriter(object):
+    """Base writer, counts the itemsets and rules written"""
+
+    def __init__(self, f, metrics):
+        self.f = f
+        self.metrics = tuple(metrics)
+        self.itemCount = 0
+        self.ruleCount = 0
+
+    def writeItem(self, item, support):
+        self.itemCount += 1
+        self._writeItem(tuple(item), support)
+
+    def writeRule(self, rule):
+        self.ruleCount += 1
+        pre, post = rule[0]
+        self._writeRule(tuple(pre), tuple(post), rule[1:])
+
+    def close(self):
+        self.f.flush()
+        if self.f not in (sys.stdout, sys.stdout.buffer):
+            self.f.close()
+
+
+class CsvWriter(ResultWriter):
+    """type,antecedent,consequent,support,<metrics>; items joined by ';'"""
+
+    def __init__(self, f, metrics):
+        ResultWriter.__init__(self, f, metrics)
+        self.writer = csv.writer(f)
+        self.writer.writerow(('type', 'antecedent', 'consequent', 'support')
+                             + self.metrics)
+
+    def _writeItem(self, item, support):
+        self.writer.writerow(('item', ';'.join(item), '', repr(support))
+                             + ('',) * len(self.metrics))
+
+    def _writeRule(self, pre, post, values):
+        self.writer.writerow(('rule', ';'.join(pre), ';'.join(post), '')
+                             + tuple(repr(value) for value in values))
+
+
+class JsonLinesWriter(ResultWriter):
+    """one JSON object per itemset / rule"""
+
+    def _writeItem(self, item, support):
+        self.f.write(json.dumps({'type': 'item', 'items': list(item),
+                                 'support': support}) + '\n')
+
+    def _writeRule(self, pre, post, values):
+        record = {'type': 'rule', 'antecedent': list(pre),
+                  'consequent': list(post)}
+        record.update(zip(self.metrics, values))
+        self.f.write(json.dumps(record) + '\n')
+
+
+class BinaryWriter(ResultWriter):
+    """
+    MAGIC, then the metric names, then one record per itemset / rule:
+        b'D' uint32 id, uint16 length, utf-8 item   (first use of an item)
+        b'I' uint16 n, n uint32 ids, float64 support
+        b'R' uint16 n, n uint32 ids, uint16 m, m uint32 ids, float64 metrics
+    """
+
+    def __init__(self, f, metrics):
+        ResultWriter.__init__(self, f, metrics)
+        self.itemIds = dict()
+        f.write(MAGIC)
+        names = ','.join(self.metrics).encode('utf-8')
+        f.write(struct.pack('<H', len(names)) + names)
+
+    def _encode(self, items):
+        ids = []
+        for item in items:
+            itemId = self.itemIds.get(item)
+            if itemId is None:
+                itemId = self.itemIds[item] = len(self.itemIds)
+                name = item.encode('utf-8')
+                self.f.write(b'D' + struct.pack('<IH', itemId, len(name))
+                             + name)
+            ids.append(itemId)
+        return struct.pack('<H%dI' % len(ids), len(ids), *ids)
+
+    def _writeItem(self, item, support):
+        ids = self._encode(item)
+        self.f.write(b'I' + ids + struct.pack('<d', support))
+
+    def _writeRule(self, pre, post, values):
+        ids = self._encode(pre) + self._encode(post)
+        self.f.write(b'R' + ids + struct.pack('<%dd' % len(values), *values))
+
+
+def openResultWriter(fname, format, metrics):
+    """Returns the writer of format ('csv', 'jsonl' or 'binary') writing to
+    fname, or to stdout if fname is None"""
+    if format == 'binary':
+        f = sys.stdout.buffer if fname is None else open(fname, 'wb')
+        return BinaryWriter(f, metrics)
+    f = sys.stdout if fname is None else open(fname, 'w', newline='')
+    if format == 'csv':
+        return CsvWriter(f, metrics)
+    return JsonLinesWriter(f, metrics)
+
+
+def readBinaryResults(fname):
+    """Yields ('item', items, support) and ('rule', (pre, post), metrics)
+    tuples from a file written by BinaryWriter"""
+    with open(fname, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a binary result file' % fname)
+        length, = struct.unpack('<H', f.read(2))
+        names = f.read(length).decode('utf-8')
+        metricCount = len(names.split(',')) if names else 0
+        items = []
+
+        def readItems():
+            count, = struct.unpack('<H', f.read(2))
+            ids = struct.unpack('<%dI' % count, f.read(4 * count))
+            return tuple(items[itemId] for itemId in ids)
+
+        while True:
+            kind = f.read(1)
+            if not kind:
+                break
+            if kind == b'D':
+                itemId, length = struct.unpack('<IH', f.read(6))
+                items.append(f.read(length).decode('utf-8'))
+            elif kind == b'I':
+                itemSet = readItems()
+                support, = struct.unpack('<d', f.read(8))
+                yield 'item', itemSet, support
+            else:
+                rule = (readItems(), readItems())
+                values = struct.unpack('<%dd' % metricCount,
+                                       f.read(8 * metricCount))
+                yield 'rule', rule, values
@@ -0,0 +1,135 @@
+"""
+Description     : Out-of-core, dictionary-encoded transaction store
+
+Every item string is mapped to an integer id and the transactions are written
+to disk as three files sharing the same prefix:
+    PATH.items      item strings, the n-th line being the item with id n
+    PATH.offsets    uint64 array, transaction i is ids[offsets[i]:offsets[i+1]]
+    PATH.ids        uint32 array of the item ids of every transaction
+plus a marker written last:
+    PATH.source     path, mtime (ns) and size of the file the store was built
+                    from ('-' when built from a stream such as stdin)
+The files are written under temporary names and moved into place, so a build
+killed half way leaves no marker and the store is rebuilt on the next run.
+The two arrays are memory-mapped when the store is opened, so transactions
+can be streamed chunk by chunk with a memory footprint bounded by the chunk
+size rather than by the number of transactions.
+"""
+
+import os
+import mmap
+from array import array
+
+
+class TransactionStore(object):
+    """Read-only view of a transaction store written by build()"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path + '.items', 'r') as f:
+            self.items = [line.rstrip('\n') for line in f]
+        self._maps = []
+        self.offsets = self._openArray(path + '.offsets', 'Q')
+        self.ids = self._openArray(path + '.ids', 'I')
+
+    def _openArray(self, fname, typecode):
+        """memory-maps fname as an array of typecode"""
+        if os.path.getsize(fname) == 0:
+            return array(typecode)
+        with open(fname, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return memoryview(mapped).cast(typecode)
+
+    @staticmethod
+    def sourceStamp(source):
+        """Returns the marker line of the input file source (None for a stream)"""
+        if source is None:
+            return '-'
+        stat = os.stat(source)
+        return '%s %d %d' % (os.path.realpath(source), stat.st_mtime_ns,
+                             stat.st_size)
+
+    @classmethod
+    def build(cls, data_iter, path, bufferSize=1 << 16, source=None):
+        """
+        Encodes the records of data_iter into a store at path and opens it.
+        source is the file data_iter reads, recorded so that exists() can tell
+        whether the store is still up to date
+        """
+        stamp = cls.sourceStamp(source)
+        if os.path.exists(path + '.source'):
+            os.remove(path + '.source')
+        itemIds = dict()
+        ids = array('I')
+        offsets = array('Q', [0])
+        position = 0
+        with open(path + '.ids.tmp', 'wb') as idsFile, \
+                open(path + '.offsets.tmp', 'wb') as offsetsFile:
+            for record in data_iter:
+                transaction = frozenset(record)
+                for item in transaction:
+                    itemId = itemIds.get(item)
+                    if itemId is None:
+                        itemId = itemIds[item] = len(itemIds)
+                    ids.append(itemId)
+                position += len(transaction)
+                offsets.append(position)
+                if len(ids) >= bufferSize:
+                    ids.tofile(idsFile)
+                    ids = array('I')
+                if len(offsets) >= bufferSize:
+                    offsets.tofile(offsetsFile)
+                    offsets = array('Q')
+            ids.tofile(idsFile)
+            offsets.tofile(offsetsFile)
+        with open(path + '.items.tmp', 'w') as itemsFile:
+            for item in sorted(itemIds, key=itemIds.get):
+                itemsFile.write(item + '\n')
+        for suffix in ('.ids', '.offsets', '.items'):
+            os.replace(path + suffix + '.tmp', path + suffix)
+        with open(path + '.source.tmp', 'w') as sourceFile:
+            sourceFile.write(stamp + '\n')
+        os.replace(path + '.source.tmp', path + '.source')
+        return cls(path)
+
+    @classmethod
+    def exists(cls, path, source=None):
+        """
+        Returns True if a complete store was built at path from the current
+        content of the file source (from a stream if source is None)
+        """
+        if not all(os.path.exists(path + suffix)
+                   for suffix in ('.items', '.offsets', '.ids')):
+            return False
+        try:
+            with open(path + '.source', 'r') as sourceFile:
+                return sourceFile.read().strip() == cls.sourceStamp(source)
+        except OSError:
+            return False
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def decode(self, itemSet):
+        """Returns the itemSet of item ids as a frozenset of item strings"""
+        return frozenset(self.items[itemId] for itemId in itemSet)
+
+    def chunks(self, chunkSize):
+        """Yields the transactions as lists of item ids, chunkSize at a time"""
+        for start in range(0, len(self), chunkSize):
+            end = min(start + chunkSize, len(self))
+            bounds = self.offsets[start:end + 1].tolist()
+            ids = self.ids[bounds[0]:bounds[-1]].tolist()
+            base = bounds[0]
+            yield [ids[bounds[i] - base:bounds[i + 1] - base]
+                   for i in range(end - start)]
+
+    def close(self):
+        for view in (self.offsets, self.ids):
+            if isinstance(view, memoryview):
+                view.release()
+        self.offsets = self.ids = None
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
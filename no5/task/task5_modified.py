@@ -7,12 +7,23 @@ Usage:
     $python apriori.py -f DATASET.csv -s 0.15 -k 0.1
 """
 
+import os
 import sys
+import time
 
-from itertools import chain, combinations
+from itertools import chain, combinations, count as counter
 from collections import defaultdict
+from heapq import heappush, heapreplace
 from optparse import OptionParser
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'no4', 'task'))
+
+from counting import (returnItemsWithMinSupportWeighted, tidListToBitset,
+                      joinSet, getItemSetTransactionList, levelStats)
+from itemset_cache import ItemSetCache
+from result_writer import openResultWriter
+
 
 def subsets(arr):
     """ Returns non empty subsets of arr"""
@@ -40,110 +51,235 @@ def returnItemsWithMinSupport(itemSet, transactionList, minSupport, freqSet):
         return _itemSet
 
 
-def joinSet(itemSet, length):
-        """Join a set with itself and returns the n-element itemsets"""
-        return set([i.union(j) for i in itemSet for j in itemSet if len(i.union(j)) == length])
-
-
-def getItemSetTransactionList(data_iterator):
-    transactionList = list()
-    itemSet = set()
-    for record in data_iterator:
-        transaction = frozenset(record)
-        transactionList.append(transaction)
+def getTidBitsets(itemSets, transactionList):
+    """Returns a dict mapping each itemSet to the bitset of the transactions
+    containing it (bit i set <=> transaction i contains the itemSet)"""
+    tidLists = defaultdict(list)
+    for tid, transaction in enumerate(transactionList):
         for item in transaction:
-            itemSet.add(frozenset([item]))              # Generate 1-itemSets
-    return itemSet, transactionList
+            tidLists[item].append(tid)
+
+    itemBits = dict()
+    for item, tids in tidLists.items():
+        itemBits[item] = tidListToBitset(tids)
+
+    tidSets = dict()
+    for itemSet in sorted(itemSets, key=len):
+        elements = iter(itemSet)
+        last = next(elements)
+        parent = itemSet.difference([last])
+        if parent in tidSets:
+            tidSets[itemSet] = tidSets[parent] & itemBits[last]
+        else:
+            bits = itemBits[last]
+            for element in elements:
+                bits &= itemBits[element]
+            tidSets[itemSet] = bits
+    return tidSets
+
+
+def findNegativeRules(allSet, freqSet, transactionList, maxKul, weights=None,
+                      topK=None, onRule=None):
+    """
+    Returns the rules ((pretuple, posttuple), P(Y|X), kulc) of the disjoint
+    frequent itemSets X, Y of allSet whose Kulczynski measure is below maxKul.
+    Each unordered pair is evaluated once, the support of X U Y is obtained
+    by intersecting the tid bitsets of X and Y, and the measure is computed
+    for all the partners of X at once. Both (X,Y) and (Y,X) are returned, in
+    the same order as a double loop over allSet
+    If weights is given, transaction i of transactionList stands for
+    weights[i] identical transactions
+    With topK, only the topK rules of lowest kulc are kept in a heap, and they
+    are returned lowest first.
+    Otherwise, if onRule is given, every rule is passed to it as soon as it is
+    found instead of being returned
+    """
+    tidSets = getTidBitsets(allSet, transactionList)
+    if weights is None:
+        transactionCount = len(transactionList)
+        weightMasks = {1: -1}
+    else:
+        transactionCount = sum(weights)
+        # 重みごとに，その重みを持つバスケットのビットマスクを作る
+        weightTids = defaultdict(list)
+        for tid, weight in enumerate(weights):
+            weightTids[weight].append(tid)
+        weightMasks = dict((weight, tidListToBitset(tids))
+                           for weight, tids in weightTids.items())
+
+    def countBits(bits):
+            """local function which Returns the weighted number of transactions
+            of a bitset"""
+            return sum(weight * bin(bits & mask).count('1')
+                       for weight, mask in weightMasks.items())
 
+    def getSupport(item):
+            """local function which Returns the support of an item"""
+            return float(freqSet[item])/transactionCount
 
-def runApriori_neg(data_iter, minSupport, maxKul):
+    toRetRules = []
+    heap = []
+    order = counter()
+
+    def keepRule(i, j, rule):
+            """local function, returns, passes on or ranks a rule"""
+            if topK is None:
+                    if onRule is None:
+                            toRetRules.append((i, j, rule))
+                    else:
+                            onRule(rule)
+            elif len(heap) < topK:
+                    heappush(heap, (-rule[2], next(order), rule))
+            elif heap and -rule[2] > heap[0][0]:
+                    heapreplace(heap, (-rule[2], next(order), rule))
+
+    for i, item1 in enumerate(allSet):
+        bits1 = tidSets[item1]
+        support1 = getSupport(item1)
+        # item1と共通の要素が無い相手をまとめて評価する
+        batch = [j for j in range(i + 1, len(allSet))
+                 if item1.isdisjoint(allSet[j])]
+        unionSupports = [float(countBits(bits1 & tidSets[allSet[j]]))/transactionCount
+                         for j in batch]
+        for j, unionSupport in zip(batch, unionSupports):
+            item2 = allSet[j]
+            p_xy = unionSupport / support1
+            p_yx = unionSupport / getSupport(item2)
+            kulc = (p_xy + p_yx) / 2
+            if kulc < maxKul:
+                keepRule(i, j, ((tuple(item1), tuple(item2)), p_xy, kulc))
+                keepRule(j, i, ((tuple(item2), tuple(item1)), p_yx, kulc))
+
+    if topK is not None:
+        return [rule for score, i, rule in sorted(heap, reverse=True)]
+    toRetRules.sort(key=lambda x: x[:2])
+    return [rule for i, j, rule in toRetRules]
+
+
+def getFrequentItemSets(itemSet, transactionList, minSupport, onLevel=None,
+                        weights=None):
     """
-    run the apriori algorithm. data_iter is a record iterator
+    run the apriori levels over transactionList
     Return both:
-     - items (tuple, support)
-     - rules ((pretuple, posttuple), confidence)
+     - freqSet (key=itemSet, value=support count)
+     - largeSet (key=n, value=set of frequent n-itemSets)
+    onLevel, if given, is called at the end of every level k with a dict of
+    its candidate and frequent counts, the time spent in joinSet and in
+    support counting, and the peak memory of the process
+    weights, if given, are the multiplicities of the distinct baskets of
+    transactionList (see getItemSetTransactionList)
     """
-    # データ取得
-    itemSet, transactionList = getItemSetTransactionList(data_iter)
-
     freqSet = defaultdict(int)
     largeSet = dict()
     # Global dictionary which stores (key=n-itemSets,value=support)
     # which satisfy minSupport
-
-    assocRules = dict()
-    # Dictionary which stores Association Rules
-
-    oneCSet = returnItemsWithMinSupport(itemSet,
-                                        transactionList,
-                                        minSupport,
-                                        freqSet)
+    transactionCount = len(transactionList) if weights is None else sum(weights)
+
+    def countSupport(candidates):
+            """local function, counts the support of the candidates"""
+            if weights is None:
+                    return returnItemsWithMinSupport(candidates,
+                                                     transactionList,
+                                                     minSupport,
+                                                     freqSet)
+            return returnItemsWithMinSupportWeighted(candidates,
+                                                     transactionList,
+                                                     weights,
+                                                     transactionCount,
+                                                     minSupport,
+                                                     freqSet)
+
+    start = time.time()
+    oneCSet = countSupport(itemSet)
+    if onLevel is not None:
+        onLevel(levelStats(1, itemSet, oneCSet, 0.0, time.time() - start))
 
     currentLSet = oneCSet
     k = 2
     while(currentLSet != set([])):
         largeSet[k - 1] = currentLSet
         # 一つ大きい要素数の組み合わせを作成する
+        start = time.time()
         currentLSet = joinSet(currentLSet, k)
-        currentCSet = returnItemsWithMinSupport(currentLSet,
-                                                transactionList,
-                                                minSupport,
-                                                freqSet)
+        joined = time.time()
+        currentCSet = countSupport(currentLSet)
+        if onLevel is not None:
+            onLevel(levelStats(k, currentLSet, currentCSet,
+                               joined - start, time.time() - joined))
         currentLSet = currentCSet
         k = k + 1
 
+    return freqSet, largeSet
+
+
+def generateNegativeResults(largeSet, freqSet, transactionList, maxKul,
+                            weights=None, topK=None):
+    """
+    Returns both the frequent items and the negatively correlated rules built
+    from the frequent itemSets in largeSet and their support counts in freqSet
+    weights are the multiplicities of the baskets of transactionList, if any
+    topK keeps only the topK rules of lowest kulc (see findNegativeRules)
+    """
+    transactionCount = len(transactionList) if weights is None else sum(weights)
+
     def getSupport(item):
             """local function which Returns the support of an item"""
-            return float(freqSet[item])/len(transactionList)
+            return float(freqSet[item])/transactionCount
 
     # 要素の組み合わせとその時のsupport値を計算する
     toRetItems = []
     for key, value in largeSet.items():
         toRetItems.extend([(tuple(item), getSupport(item))
                            for item in value])
-    toRetRules = []
     # minSupport以上の全組み合わせ
     allSet = []
     for key, value in list(largeSet.items()):
         for i in value:
             allSet.append(i)
 
-    # item1とitem2はset()
-    for item1 in allSet:
-        for item2 in allSet:
-            # 共通の要素が無い場合
-            if len(item1 & item2) == 0:
-                # item_union = item1 U item2
-                item_union = item1.union(item2)
-
-                # 和集合の出現回数を計算する
-                if freqSet[item_union] == 0:
-                    for transaction in transactionList:
-                        if item_union.issubset(transaction):
-                            freqSet[item_union] += 1
-                # Kulczynski 尺度基準を計算
-                # 前提：アイテム集合XとYは頻出である
-                # (P(X|Y) + P(Y|X)) / 2 < e
-                # conf(A => B) = P(B|A) = sup(A U B)/sup(A)
-                p_xy = getSupport(item_union) / getSupport(item1)
-                p_yx = getSupport(item_union) / getSupport(item2)
-                kulc = (p_xy + p_yx) / 2
-                # 算出したkulcに従ってルールとするかどうかを判定する
-                if kulc < maxKul:
-                        toRetRules.append(((tuple(item1), tuple(item2)), p_xy, kulc))
+    # Kulczynski 尺度基準を計算
+    # 前提：アイテム集合XとYは頻出である
+    # (P(X|Y) + P(Y|X)) / 2 < e
+    toRetRules = findNegativeRules(allSet, freqSet, transactionList, maxKul,
+                                   weights, topK)
 
     return toRetItems, toRetRules
 
-def printResults(items, rules):
-    """prints the generated itemsets sorted by support and the confidence rules sorted by confidence"""
+
+def runApriori_neg(data_iter, minSupport, maxKul, onLevel=None,
+                   counting='horizontal'):
+    """
+    run the apriori algorithm. data_iter is a record iterator
+    Return both:
+     - items (tuple, support)
+     - rules ((pretuple, posttuple), confidence)
+    onLevel is the per-level hook of getFrequentItemSets
+    counting='weighted' collapses identical transactions into distinct
+    baskets counted with their number of occurrences
+    """
+    # データ取得
+    weights = list() if counting == 'weighted' else None
+    itemSet, transactionList = getItemSetTransactionList(data_iter,
+                                                         weights=weights)
+
+    freqSet, largeSet = getFrequentItemSets(itemSet, transactionList, minSupport,
+                                            onLevel, weights)
+
+    return generateNegativeResults(largeSet, freqSet, transactionList, maxKul,
+                                   weights)
+
+def printResults(items, rules, out=None):
+    """prints the generated itemsets sorted by support and the confidence rules sorted by confidence
+    to out (stdout by default)"""
+    out = sys.stdout if out is None else out
     item_list = sorted(items, key=lambda x: x[1])
     for item, support in item_list:
-        print("item: %s , %.3f" % (str(item), support))
-    print("\n------------------------ RULES:")
+        print("item: %s , %.3f" % (str(item), support), file=out)
+    print("\n------------------------ RULES:", file=out)
     rule_list = sorted(rules, key=lambda x: x[2])
     for rule, confidence,kulc in rule_list:
         pre, post = rule
-        print("Rule: %s ==> %s , conf=%.3f, kulc=%.3f" % (str(pre), str(post), confidence,kulc))
+        print("Rule: %s ==> %s , conf=%.3f, kulc=%.3f" % (str(pre), str(post), confidence,kulc), file=out)
 
 def dataFromFile(fname):
         """Function which reads from the file and yields a generator"""
@@ -172,6 +308,34 @@ if __name__ == "__main__":
                          default=0.1,
                          type='float')
 
+    optparser.add_option('--counting',
+                         dest='counting',
+                         help='support counting: horizontal, or weighted to collapse identical transactions',
+                         default='horizontal',
+                         type='choice',
+                         choices=['horizontal', 'weighted'])
+
+    optparser.add_option('-t', '--topK', '--top',
+                         dest='topK',
+                         help='only keep the topK rules of lowest kulczynski value',
+                         default=None,
+                         type='int')
+
+    optparser.add_option('-o', '--output',
+                         dest='output',
+                         help='file the results are written to (stdout by default); text is sorted first, the other formats are streamed',
+                         default=None)
+    optparser.add_option('--format',
+                         dest='format',
+                         help='output format: text (sorted, as printResults), csv, jsonl or binary',
+                         default='text',
+                         type='choice',
+                         choices=['text', 'csv', 'jsonl', 'binary'])
+    optparser.add_option('--cache',
+                         dest='cache',
+                         help='directory caching the frequent itemsets of the input file',
+                         default=None)
+
     (options, args) = optparser.parse_args()
 
     inFile = None
@@ -185,5 +349,45 @@ if __name__ == "__main__":
 
     minSupport = options.minS
     maxKul = options.maxK
-    items, rules = runApriori_neg(inFile, minSupport, maxKul)
-    printResults(items, rules)
+    weights = list() if options.counting == 'weighted' else None
+    itemSet, transactionList = getItemSetTransactionList(inFile,
+                                                         weights=weights)
+    transactionCount = len(transactionList) if weights is None else sum(weights)
+
+    cache = None
+    mined = None
+    if options.cache is not None and options.input is not None:
+        cache = ItemSetCache(options.cache)
+        mined = cache.load(options.input, minSupport)
+
+    if mined is None:
+        freqSet, largeSet = getFrequentItemSets(itemSet, transactionList,
+                                                minSupport, weights=weights)
+        if cache is not None:
+            cache.save(options.input, minSupport, freqSet, largeSet,
+                       transactionCount)
+    else:
+        freqSet, largeSet, transactionCount = mined
+    if options.format == 'text':
+        items, rules = generateNegativeResults(largeSet, freqSet,
+                                               transactionList, maxKul,
+                                               weights, options.topK)
+        out = sys.stdout if options.output is None else open(options.output, 'w')
+        printResults(items, rules, out)
+        if out is not sys.stdout:
+            out.close()
+    else:
+        # itemsets and rules are written as soon as they are produced
+        writer = openResultWriter(options.output, options.format,
+                                  ('confidence', 'kulc'))
+        allSet = []
+        for key, value in largeSet.items():
+            for item in value:
+                writer.writeItem(item, float(freqSet[item])/transactionCount)
+                allSet.append(item)
+        rules = findNegativeRules(allSet, freqSet, transactionList, maxKul,
+                                  weights, topK=options.topK,
+                                  onRule=writer.writeRule)
+        for rule in rules:
+            writer.writeRule(rule)
+        writer.close()
@@ -7,27 +7,109 @@ Usage:
     $python dbscan.py -f DATASET.csv -e EPSILON -m minPoitns
 
     $python dbscan.py -f crater.csv -e 0.8 -m 2
+
+    $python dbscan.py -f crater.csv -e 0.8 -m 2 --engine grid
+
+    $python dbscan.py -f data2.csv --sweepEps 0.4,0.5 --sweepMinPoints 10,35
+
+    $python dbscan.py -f data2.csv -m 35 --sweepEps 0.3,0.4,0.5 --reachability data2
 """
-from sklearn.cluster import DBSCAN
+import os
+import sys
+try:
+    from sklearn.cluster import DBSCAN
+except ImportError:                                     # grid engine only
+    DBSCAN = None
 import csv
 from collections import defaultdict
 from optparse import OptionParser
 import matplotlib.pyplot as plt
 
+from my_dbscan import NeighborGraph, ReachabilityOrdering, data_fingerprint
+from feature_cache import loadFeatures
+
 ##################
 # クラスタリング結果を返すように実装してください
-def clustering(feature, eps, minPoints):
+def clustering(feature, eps, minPoints, engine='sklearn'):
+    # engine='grid' は my_dbscan (格子で近傍探索するnumpy実装) を使う
+    if engine == 'grid':
+        return NeighborGraph(feature, eps).labels(eps, minPoints)
     pred = DBSCAN(eps=eps, min_samples=minPoints).fit_predict(feature)
     return pred
 ##################
 
-def dataFromFile(fname):
-        """Function which reads from the file and yields a generator"""
-        file_iter = open(fname, 'rU')
-        for line in file_iter:
-                line = line.strip().rstrip(',')                         # Remove trailing comma
-                record = line.split(',')
-                yield record
+def sweepClustering(feature, epsList, minPointsList):
+    """
+    最大のepsで近傍グラフを一度だけ作り，全ての (eps, minPoints) の組の
+    クラスタリング結果を返す (key=(eps, minPoints), value=pred)
+    """
+    graph = NeighborGraph(feature, max(epsList))
+    return dict(((eps, minPoints), graph.labels(eps, minPoints))
+                for eps in epsList for minPoints in minPointsList)
+
+def reachabilityPath(prefix, minPoints):
+    """minPointsごとの到達可能性順序のファイル名 PREFIX_m<minPoints>.npz を返す"""
+    if prefix.endswith('.npz'):
+        prefix = prefix[:-len('.npz')]
+    return '%s_m%d.npz' % (prefix, minPoints)
+
+def loadReachability(path, fingerprint, minPoints, maxEps):
+    """
+    pathに保存された到達可能性順序を返す．無い場合，または別のデータ
+    (data_fingerprintが異なる) かminPointsが異なるか，max_epsがmaxEpsより
+    小さい場合はNoneを返す
+    """
+    if not os.path.exists(path):
+        return None
+    ordering = ReachabilityOrdering.load(path)
+    if ordering.fingerprint == fingerprint and \
+            ordering.min_points == minPoints and ordering.max_eps >= maxEps:
+        return ordering
+    return None
+
+def reachabilityClustering(feature, epsList, minPointsList, prefix, maxEps=None):
+    """
+    到達可能性順序の線形走査で全ての (eps, minPoints) の組のクラスタリング結果を
+    返す (key=(eps, minPoints), value=pred)．順序はminPointsごとに計算して
+    PREFIX_m<minPoints>.npz に保存され，以降の実行ではmaxEps以下のepsについて
+    読み込むだけで済む
+    """
+    if maxEps is None:
+        maxEps = max(epsList)
+    fingerprint = data_fingerprint(feature)
+    results = dict()
+    graph = None
+    for minPoints in minPointsList:
+        path = reachabilityPath(prefix, minPoints)
+        ordering = loadReachability(path, fingerprint, minPoints, maxEps)
+        if ordering is None:
+            # 計算し直すminPointsが複数あっても近傍探索は一度だけ
+            if graph is None:
+                graph = NeighborGraph(feature, maxEps)
+            ordering = ReachabilityOrdering.compute(feature, minPoints, maxEps,
+                                                    graph)
+            ordering.save(path)
+        for eps in epsList:
+            results[(eps, minPoints)] = ordering.labels(eps)
+    return results
+
+def plotClusters(feature, pred, title):
+    """plots the points of every cluster (noise, -1, is the last one)"""
+    plt.figure()
+    plt.title(title)
+    x=[]
+    y=[]
+    for i in range(len(set(pred))):
+        x.append([])
+        y.append([])
+    for i in range(len(pred)):
+        x[pred[i]].append(feature[i][0])
+        y[pred[i]].append(feature[i][1])
+    color_list=['red','blue','yellow','green','purple','c', 'olivedrab']
+    for i in range(len(x)):
+        plt.scatter(x[i],y[i],label=i, c=color_list[i % len(color_list)])
+    plt.legend()
+
 if __name__ == '__main__':
 
     optparser = OptionParser()
@@ -35,6 +117,11 @@ if __name__ == '__main__':
                          dest='input',
                          help='filename containing csv',
                          default=None)
+    optparser.add_option('--noCache',
+                         dest='noCache',
+                         help='parse the csv without reading or writing its .npy cache',
+                         default=False,
+                         action='store_true')
     optparser.add_option('-e', '--epsilon',
                          dest='eps',
                          help='threshold for marge step',
@@ -45,15 +132,30 @@ if __name__ == '__main__':
                          help='minimum number of points for cluster',
                          default=2,
                          type='int')
+    optparser.add_option('--engine',
+                         dest='engine',
+                         help='dbscan engine: sklearn or grid (my_dbscan)',
+                         default='sklearn',
+                         type='choice',
+                         choices=['sklearn', 'grid'])
+    optparser.add_option('--sweepEps',
+                         dest='sweepEps',
+                         help='comma separated eps values, clustered from one neighbor search',
+                         default=None)
+    optparser.add_option('--sweepMinPoints',
+                         dest='sweepMinPoints',
+                         help='comma separated minPoints values, clustered from one neighbor search',
+                         default=None)
+    optparser.add_option('--reachability',
+                         dest='reachability',
+                         help='prefix of the npz files of the OPTICS reachability orderings (PREFIX_m<minPoints>.npz), computed and saved if missing or made from other data, then scanned for every eps',
+                         default=None)
+    optparser.add_option('--maxEps',
+                         dest='maxEps',
+                         help='largest eps the saved reachability ordering answers (the largest eps given by default)',
+                         default=None,
+                         type='float')
     (options, args) = optparser.parse_args()
-    inFile = None
-    if options.input is None:
-            inFile = sys.stdin
-    elif options.input is not None:
-            inFile = dataFromFile(options.input)
-    else:
-            print('No dataset filename specified, system with exit\n')
-            sys.exit('System will exit')
     eps = options.eps
     minPoints = options.minPoints
 ##################
@@ -61,23 +163,29 @@ if __name__ == '__main__':
 #    [1,0,0,2,1,0]
 #    この場合、要素の一つ目がクラスタ1に、二つ目がクラスタ0に属していることを意味しています
 ##################
-    feature=[]
-    for record in inFile:
-        feature.append(list(map(float,record)))
-    pred = clustering(feature,eps,minPoints)
+    # 2回目以降はcsvを解析せず，DATASET.csv.npy をメモリマップして読む
+    feature = loadFeatures(sys.stdin if options.input is None else options.input,
+                           cache=not options.noCache)
+    if options.sweepEps is not None or options.sweepMinPoints is not None \
+            or options.reachability is not None:
+        # 近傍探索は一度だけで，組み合わせごとにプロットする
+        epsList = [eps] if options.sweepEps is None else \
+            [float(value) for value in options.sweepEps.split(',')]
+        minPointsList = [minPoints] if options.sweepMinPoints is None else \
+            [int(value) for value in options.sweepMinPoints.split(',')]
+        if options.reachability is not None:
+            results = reachabilityClustering(feature, epsList, minPointsList,
+                                             options.reachability, options.maxEps)
+        else:
+            results = sweepClustering(feature, epsList, minPointsList)
+        for (eps, minPoints), pred in sorted(results.items()):
+            print("eps: %.3f , minPoints: %d , clusters=%d, noise=%d"
+                  % (eps, minPoints, pred.max() + 1, (pred == -1).sum()))
+            plotClusters(feature, pred, "dbscan eps=%g m=%d" % (eps, minPoints))
+        plt.show()
+        sys.exit()
+    pred = clustering(feature,eps,minPoints,options.engine)
 
 #plot nodes
-    plt.title("dbscan")
-    x=[]
-    y=[]
-    for i in range(len(set(pred))):
-        x.append([])
-        y.append([])
-    for i in range(len(pred)):
-        x[pred[i]].append(feature[i][0])
-        y[pred[i]].append(feature[i][1])
-    color_list=['red','blue','yellow','green','purple','c', 'olivedrab']
-    for i in range(len(x)):
-        plt.scatter(x[i],y[i],label=i, c=color_list[i])
-    plt.legend()
+    plotClusters(feature, pred, "dbscan")
     plt.show()
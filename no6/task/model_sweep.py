@@ -0,0 +1,193 @@
+"""
+Description     : Parallel model-selection sweep used by kmeans.py / gmm.py
+
+Fits one model per candidate number of clusters (k, or mixture components)
+on a process pool. The feature matrix is copied once into shared memory and
+every worker maps it, instead of receiving a pickled copy per task. Each
+candidate is reported with:
+    inertia       sum of squared distances to the mean of its cluster
+    silhouette    mean silhouette coefficient (on a sample of the points)
+    bic / aic     given by the fit function, or for k-means those of the
+                  identical spherical Gaussians model of X-means
+and the best candidate is selected by one of them.
+
+Usage:
+    best, reports = sweep(feature, range(2, 11), fitKMeans, criterion='bic')
+"""
+
+import math
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# feature matrix mapped by the current worker process (see attachFeatures)
+sharedFeatures = None
+sharedMemory = None
+
+# True if the larger value of the criterion is the better one
+CRITERIA = {'inertia': False, 'silhouette': True, 'bic': False, 'aic': False}
+
+
+def attachFeatures(name, shape, dtype):
+    """Pool initializer, maps the shared feature matrix in the worker"""
+    global sharedFeatures, sharedMemory
+    sharedMemory = shared_memory.SharedMemory(name=name)
+    sharedFeatures = np.ndarray(shape, dtype=dtype, buffer=sharedMemory.buf)
+
+
+def clusterInertia(feature, labels):
+    """Returns the sum of squared distances of the points to the mean of their
+    cluster (noise points, labelled -1, are ignored)"""
+    kept = labels >= 0
+    feature = feature[kept]
+    labels = labels[kept]
+    if not len(labels):
+        return 0.0
+    counts = np.bincount(labels)
+    inertia = float(np.einsum('ij,ij->', feature, feature, dtype=np.float64))
+    for dim in range(feature.shape[1]):
+        sums = np.bincount(labels, weights=feature[:, dim])
+        inertia -= float((sums[counts > 0] ** 2 / counts[counts > 0]).sum())
+    return max(inertia, 0.0)
+
+
+def silhouetteScore(feature, labels, sampleSize=5000, seed=0, chunkSize=1024):
+    """
+    Returns the mean silhouette coefficient of the points, computed on a
+    random sample of sampleSize points (all of them if None), or nan if the
+    points are not in at least 2 clusters
+    """
+    kept = np.flatnonzero(labels >= 0)
+    if sampleSize is not None and len(kept) > sampleSize:
+        kept = np.random.default_rng(seed).choice(kept, sampleSize,
+                                                  replace=False)
+    points = np.asarray(feature[kept], dtype=np.float64)
+    labels = np.unique(labels[kept], return_inverse=True)[1]
+    clusterNum = labels.max() + 1 if len(labels) else 0
+    if clusterNum < 2:
+        return float('nan')
+    counts = np.bincount(labels, minlength=clusterNum)
+    membership = np.zeros((len(points), clusterNum))
+    membership[np.arange(len(points)), labels] = 1
+    norms = np.einsum('ij,ij->i', points, points)
+
+    scores = np.empty(len(points))
+    for start in range(0, len(points), chunkSize):
+        end = min(start + chunkSize, len(points))
+        distances = norms[start:end, np.newaxis] - 2 * points[start:end] @ points.T \
+            + norms
+        np.sqrt(np.maximum(distances, 0, out=distances), out=distances)
+        # sum of the distances to the points of each cluster
+        sums = distances @ membership
+        own = labels[start:end]
+        rows = np.arange(end - start)
+        sizes = counts[own] - 1
+        a = np.where(sizes > 0, sums[rows, own] / np.maximum(sizes, 1), 0)
+        means = sums / counts
+        means[rows, own] = np.inf
+        b = means.min(axis=1)
+        score = (b - a) / np.maximum(np.maximum(a, b), 1e-300)
+        # the silhouette of a point alone in its cluster is 0
+        scores[start:end] = np.where(sizes > 0, score, 0)
+    return float(scores.mean())
+
+
+def kmeansInformationCriteria(feature, labels, inertia):
+    """
+    Returns (bic, aic) of a k-means partition seen as a mixture of identical
+    spherical Gaussians (Pelleg & Moore, X-means); lower is better
+    """
+    n, dim = feature.shape
+    counts = np.bincount(labels)
+    counts = counts[counts > 0]
+    k = len(counts)
+    if n <= k:
+        return float('nan'), float('nan')
+    variance = max(inertia / (dim * (n - k)), 1e-300)
+    logLikelihood = float((counts * np.log(counts)).sum()) - n * math.log(n) \
+        - n * dim / 2 * math.log(2 * math.pi * variance) - dim * (n - k) / 2
+    parameters = (k - 1) + k * dim + 1
+    return (-2 * logLikelihood + parameters * math.log(n),
+            -2 * logLikelihood + 2 * parameters)
+
+
+def evaluate(task):
+    """Fits one candidate on the shared feature matrix and returns its report"""
+    fitOne, k, options = task
+    feature = sharedFeatures
+    result = fitOne(feature, k, **options)
+    labels = np.asarray(result['labels'])
+    inertia = result.get('inertia')
+    if inertia is None:
+        inertia = clusterInertia(feature, labels)
+    bic, aic = result.get('bic'), result.get('aic')
+    if bic is None:
+        bic, aic = kmeansInformationCriteria(feature, labels, inertia)
+    return {'k': k,
+            'inertia': inertia,
+            'silhouette': silhouetteScore(feature, labels),
+            'bic': bic,
+            'aic': aic,
+            'model': result['model'],
+            'labels': labels}
+
+
+def sweep(feature, candidates, fitOne, criterion='silhouette', workers=None,
+          **options):
+    """
+    Fits fitOne(feature, k, **options) for every k of candidates on a pool of
+    workers (one per candidate by default, at most one per cpu). fitOne must
+    be a module level function returning a dict with 'model' and 'labels',
+    and optionally 'inertia', 'bic' and 'aic'.
+    Returns the report of the best candidate by criterion and the reports of
+    every candidate, in the order of candidates
+    """
+    feature = np.ascontiguousarray(feature, dtype=np.float64)
+    candidates = list(candidates)
+    if workers is None:
+        workers = min(len(candidates), multiprocessing.cpu_count())
+
+    memory = shared_memory.SharedMemory(create=True, size=max(feature.nbytes, 1))
+    try:
+        np.ndarray(feature.shape, dtype=feature.dtype,
+                   buffer=memory.buf)[...] = feature
+        with multiprocessing.Pool(workers, attachFeatures,
+                                  (memory.name, feature.shape,
+                                   feature.dtype.str)) as pool:
+            reports = pool.map(evaluate,
+                               [(fitOne, k, options) for k in candidates],
+                               chunksize=1)
+    finally:
+        memory.close()
+        memory.unlink()
+
+    def score(report):
+            """local function, larger is better, nan is the worst"""
+            value = report[criterion]
+            if value is None or math.isnan(value):
+                    return -math.inf
+            return value if CRITERIA[criterion] else -value
+
+    return max(reports, key=score), reports
+
+
+def printReports(reports, best, name='k'):
+    """prints one line per candidate, then the best one"""
+    for report in reports:
+        print("%s: %d , inertia=%.3f, silhouette=%.3f, bic=%.3f, aic=%.3f"
+              % (name, report['k'], report['inertia'], report['silhouette'],
+                 report['bic'], report['aic']))
+    print("best: %s=%d" % (name, best['k']))
+
+
+def parseCandidates(text):
+    """'2-10' or '2,4,8' -> list of ints"""
+    candidates = []
+    for part in text.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            candidates.extend(range(int(first), int(last) + 1))
+        else:
+            candidates.append(int(part))
+    return candidates
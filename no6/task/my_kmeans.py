@@ -1,39 +1,412 @@
 import numpy as np
-import random
+
+
+def as_float_array(datas, dtype=None):
+    '''
+    datasを (点数 x 次元数) の連続したfloat配列に変換する
+    dtypeを指定しない場合，float32の配列はそのまま，それ以外はfloat64にする
+    '''
+    datas = np.asarray(datas)
+    if dtype is None:
+        dtype = np.float32 if datas.dtype == np.float32 else np.float64
+    datas = np.ascontiguousarray(datas, dtype=dtype)
+    if datas.ndim == 1:
+        datas = datas.reshape(-1, 1)
+    return datas
+
+
+def reservoir_sample(chunks, sample_size, random_state=None):
+    '''
+    チャンクの列 (点数 x 次元数の配列) から，全点の中で一様にsample_size点を
+    一度の走査で選んで返す (Vitter, 1985 の Algorithm R をチャンク単位で行う)
+    '''
+    rng = np.random.default_rng(random_state)
+    sample = None
+    seen = 0
+    for chunk in chunks:
+        chunk = np.asarray(chunk)
+        if sample is None:
+            sample = np.empty((sample_size, chunk.shape[1]), dtype=chunk.dtype)
+        # 最初のsample_size点はそのまま入れる
+        filled = min(max(sample_size - seen, 0), len(chunk))
+        sample[seen:seen + filled] = chunk[:filled]
+        # 以降のi番目の点は確率sample_size/(i+1)で一様に選んだ位置を置き換える
+        slots = rng.integers(0, np.arange(seen + filled, seen + len(chunk)) + 1)
+        replaced = np.flatnonzero(slots < sample_size)
+        # 同じ位置が複数回選ばれたら後の点が残る
+        slots, last = np.unique(slots[replaced][::-1], return_index=True)
+        sample[slots] = chunk[filled + replaced[::-1][last]]
+        seen += len(chunk)
+    if sample is None:
+        return np.empty((0, 0))
+    return sample[:min(seen, sample_size)]
+
+
+def squared_norms(datas):
+    '''
+    各点の二乗ノルムを返す
+    '''
+    return np.einsum('ij,ij->i', datas, datas)
+
+
+def squared_distances(datas, centroids, datas_norm=None):
+    '''
+    datasの各点とcentroidsの各重心の二乗距離の行列 (点数 x 重心数) を返す
+    |x - c|^2 = |x|^2 - 2x.c + |c|^2 として行列積でまとめて計算する
+    '''
+    if datas_norm is None:
+        datas_norm = squared_norms(datas)
+    distances = datas @ centroids.T
+    distances *= -2
+    distances += datas_norm[:, np.newaxis]
+    distances += squared_norms(centroids)
+    # 丸め誤差で負にならないようにする
+    np.maximum(distances, 0, out=distances)
+    return distances
+
+
+def cluster_sums(datas, labels, cluster_num):
+    '''
+    各クラスタに属する点の数と座標の和を返す
+    '''
+    counts = np.bincount(labels, minlength=cluster_num)
+    sums = np.empty((cluster_num, datas.shape[1]), dtype=np.float64)
+    for dim in range(datas.shape[1]):
+        sums[:, dim] = np.bincount(labels, weights=datas[:, dim],
+                                   minlength=cluster_num)
+    return counts, sums
+
+
+def update_centroids(datas, labels, cluster_num, min_distances):
+    '''
+    各クラスタに属する点の平均を新しい重心として返す
+    空になったクラスタの重心は，所属する重心から最も遠い点に移す
+    '''
+    counts, sums = cluster_sums(datas, labels, cluster_num)
+    empty = np.flatnonzero(counts == 0)
+    if len(empty):
+        farthest = np.argsort(min_distances)[::-1][:len(empty)]
+        sums[empty] = datas[farthest]
+        counts[empty] = 1
+    return (sums / counts[:, np.newaxis]).astype(datas.dtype)
+
+
+def assigned_squared_distances(datas, centroids, labels, datas_norm):
+    '''
+    各点とlabelsが示す重心との二乗距離を返す (点ごとに1回の距離計算)
+    '''
+    assigned = centroids[labels]
+    distances = datas_norm - 2 * np.einsum('ij,ij->i', datas, assigned)
+    distances += squared_norms(assigned)
+    np.maximum(distances, 0, out=distances)
+    return distances
+
 
 class KMeams(object):
-    def __init__(self,cluster_num):
+    '''
+    k-means++で初期化するk-means (Lloyd法)
+    距離計算と所属クラスタの計算はnumpyの行列演算で行い，点ごとのループは持たない
+    '''
+
+    def __init__(self, cluster_num, n_init=10, max_iter=300, tol=1e-4,
+                 dtype=None, random_state=None, chunk_size=65536,
+                 algorithm='lloyd'):
+        '''
+        n_init       : 初期値を変えて実行する回数 (inertiaが最小の結果を採用)
+        max_iter     : 1回の実行での最大反復回数
+        tol          : 重心の移動量の二乗和がデータの分散の平均のtol倍以下で収束とする
+        dtype        : 計算に使うfloat型 (Noneなら入力がfloat32の時だけfloat32)
+        random_state : 乱数のシード
+        chunk_size   : 距離行列を一度に計算する点数 (メモリ使用量の上限になる)
+        algorithm    : 'lloyd'，または三角不等式で不要な距離計算を省く'hamerly'
+                       (所属クラスタはlloydと同じになる)
+        '''
         self.cluster_num = cluster_num
-        # 次元数は入力データの次元数と同じにする必要あり
-        self.centroids = [(random.random(),random.random()) for i in range(cluster_num)]
+        self.n_init = n_init
+        self.max_iter = max_iter
+        self.tol = tol
+        self.dtype = dtype
+        self.random_state = random_state
+        self.chunk_size = chunk_size
+        self.algorithm = algorithm
+        # 次元数は入力データの次元数と同じにする必要あり (fitで決まる)
+        self.centroids = None
+        self.labels = None
+        self.inertia = None
+        self.n_iter = None
+        # 所属クラスタの計算で行った点-重心 (重心-重心を含む) の距離計算の回数と，
+        # 同じ反復をlloydで行った場合の回数 (n_init回の合計)
+        self.n_distances = None
+        self.n_distances_lloyd = None
 
     def fit(self, datas):
         '''
+        k個のクラスタを構築する
+        datasはlistのlist，または (点数 x 次元数) の配列を想定
+        '''
+        datas = as_float_array(datas, self.dtype)
+        if len(datas) < self.cluster_num:
+            raise ValueError('number of points (%d) must be >= cluster_num (%d)'
+                             % (len(datas), self.cluster_num))
+        rng = np.random.default_rng(self.random_state)
+        datas_norm = squared_norms(datas)
+        tol = self.tol * float(np.var(datas, axis=0).mean())
 
+        run = self.run_hamerly if self.algorithm == 'hamerly' else self.run_lloyd
+        self.n_distances = 0
+        self.n_distances_lloyd = 0
+        best = None
+        for i in range(self.n_init):
+            result = run(datas, datas_norm, tol, rng)
+            if best is None or result[2] < best[2]:
+                best = result
+        self.centroids, self.labels, self.inertia, self.n_iter = best
+        return self
+
+    @property
+    def n_distances_saved(self):
+        '''
+        lloydと比べて省いた距離計算の回数
         '''
-        set_initial_centroids(datas)
-        pass
+        return self.n_distances_lloyd - self.n_distances
 
     def fit_predict(self, datas):
         '''
         k個のクラスタを構築してdatasの各点が所属するクラスタインデックスを返す
         datasはlistのlistを想定
         '''
-        set_initial_centroids(datas)
-        old_centroids = self.centroids
-        calc_belong_cluster(datas,self.centroids)
+        return self.fit(datas).labels
+
+    def predict(self, datas):
+        '''
+        datasの各点に最も近い重心のインデックスを返す
+        '''
+        datas = as_float_array(datas, self.centroids.dtype)
+        labels, min_distances = self.calc_belong_cluster(datas, self.centroids,
+                                                         squared_norms(datas))
+        return labels
+
+    def run_lloyd(self, datas, datas_norm, tol, rng):
+        '''
+        1回分のk-meansを実行し，(重心, 所属クラスタ, inertia, 反復回数) を返す
+        '''
+        centroids = self.set_initial_centroids(datas, datas_norm, rng)
+        for n_iter in range(1, self.max_iter + 1):
+            labels, min_distances = self.calc_belong_cluster(datas, centroids,
+                                                             datas_norm)
+            new_centroids = update_centroids(datas, labels, self.cluster_num,
+                                             min_distances)
+            shift = float(((new_centroids - centroids) ** 2).sum())
+            centroids = new_centroids
+            if shift <= tol:
+                break
+        labels, min_distances = self.calc_belong_cluster(datas, centroids,
+                                                         datas_norm)
+        inertia = float(min_distances.sum(dtype=np.float64))
+        self.n_distances += (n_iter + 1) * len(datas) * self.cluster_num
+        self.n_distances_lloyd += (n_iter + 1) * len(datas) * self.cluster_num
+        return centroids, labels, inertia, n_iter
 
-        pass
+    def run_hamerly(self, datas, datas_norm, tol, rng):
+        '''
+        Hamerly (2010) の方法で1回分のk-meansを実行する (戻り値はrun_lloydと同じ)
+        各点について所属する重心までの距離の上界と，それ以外の重心までの距離の
+        下界を持ち，上界が下界 (と最も近い重心間距離の半分) 以下の点は
+        所属クラスタが変わらないので距離を計算しない
+        '''
+        n = len(datas)
+        k = self.cluster_num
+        centroids = self.set_initial_centroids(datas, datas_norm, rng)
+        # 初回は全ての距離を計算する
+        labels, upper, lower = self.calc_nearest_two(datas, centroids,
+                                                     datas_norm)
+        self.n_distances += n * k
+        for n_iter in range(1, self.max_iter + 1):
+            if n_iter > 1:
+                self.assign_bounded(datas, centroids, datas_norm, labels,
+                                    upper, lower)
+            min_distances = upper ** 2
+            if (np.bincount(labels, minlength=k) == 0).any():
+                # 空のクラスタの移動先はlloydと同じく正確な距離で選ぶ
+                min_distances = assigned_squared_distances(datas, centroids,
+                                                           labels, datas_norm)
+                self.n_distances += n
+            new_centroids = update_centroids(datas, labels, k, min_distances)
+            shift = float(((new_centroids - centroids) ** 2).sum())
+            moves = np.sqrt(((new_centroids - centroids) ** 2).sum(axis=1))
+            centroids = new_centroids
+            # 重心の移動量だけ上界を広げ，下界を狭める
+            upper += moves[labels]
+            if k > 1:
+                order = np.argsort(moves)
+                lower -= np.where(labels == order[-1], moves[order[-2]],
+                                  moves[order[-1]])
+            if shift <= tol:
+                break
+        self.assign_bounded(datas, centroids, datas_norm, labels, upper, lower)
+        min_distances = assigned_squared_distances(datas, centroids, labels,
+                                                   datas_norm)
+        self.n_distances += n
+        inertia = float(min_distances.sum(dtype=np.float64))
+        self.n_distances_lloyd += (n_iter + 1) * n * k
+        return centroids, labels, inertia, n_iter
+
+    def assign_bounded(self, datas, centroids, datas_norm, labels, upper, lower):
+        '''
+        labels, upper, lowerをその場で更新し，境界から所属クラスタが変わらないと
+        分かる点以外についてだけ距離を計算する
+        '''
+        k = self.cluster_num
+        center_distances = np.sqrt(squared_distances(centroids, centroids))
+        np.fill_diagonal(center_distances, np.inf)
+        self.n_distances += k * k
+        bound = np.maximum(0.5 * center_distances.min(axis=1)[labels], lower)
+        candidates = np.flatnonzero(upper > bound)
+        # まず上界を正確な距離に締め直す
+        upper[candidates] = np.sqrt(assigned_squared_distances(
+            datas[candidates], centroids, labels[candidates],
+            datas_norm[candidates]))
+        self.n_distances += len(candidates)
+        candidates = candidates[upper[candidates] > bound[candidates]]
+        # それでも境界を超える点は全ての重心との距離を計算する
+        labels[candidates], upper[candidates], lower[candidates] = \
+            self.calc_nearest_two(datas[candidates], centroids,
+                                  datas_norm[candidates])
+        self.n_distances += len(candidates) * k
+
+    def calc_nearest_two(self, datas, centroids, datas_norm):
+        '''
+        各点に最も近い重心のインデックスと，最も近い重心，2番目に近い重心
+        までの距離を返す
+        '''
+        n = len(datas)
+        labels = np.empty(n, dtype=np.intp)
+        nearest = np.empty(n, dtype=datas.dtype)
+        second = np.full(n, np.inf, dtype=datas.dtype)
+        for start in range(0, n, self.chunk_size):
+            end = min(start + self.chunk_size, n)
+            distances = squared_distances(datas[start:end], centroids,
+                                          datas_norm[start:end])
+            rows = np.arange(end - start)
+            labels[start:end] = distances.argmin(axis=1)
+            nearest[start:end] = distances[rows, labels[start:end]]
+            if len(centroids) > 1:
+                distances[rows, labels[start:end]] = np.inf
+                second[start:end] = distances.min(axis=1)
+        return labels, np.sqrt(nearest), np.sqrt(second)
+
+    def set_initial_centroids(self, datas, datas_norm, rng):
+        '''
+        k-means++で初期重心を選ぶ
+        既存の重心からの二乗距離に比例する確率で候補点を2+log(k)個選び，
+        二乗距離の総和を最も小さくする候補を次の重心とする
+        '''
+        n = len(datas)
+        trials = 2 + int(np.log(self.cluster_num))
+        centroids = np.empty((self.cluster_num, datas.shape[1]),
+                             dtype=datas.dtype)
+        centroids[0] = datas[rng.integers(n)]
+        closest = squared_distances(datas, centroids[:1],
+                                    datas_norm)[:, 0].astype(np.float64)
+        for c in range(1, self.cluster_num):
+            cumulative = np.cumsum(closest)
+            if cumulative[-1] <= 0:
+                # 全ての点が既存の重心と重なっている
+                candidates = rng.integers(n, size=trials)
+            else:
+                candidates = np.searchsorted(cumulative,
+                                             rng.random(trials) * cumulative[-1])
+                candidates = np.minimum(candidates, n - 1)
+            distances = squared_distances(datas, datas[candidates], datas_norm)
+            distances = np.minimum(distances, closest[:, np.newaxis])
+            best = int(distances.sum(axis=0).argmin())
+            centroids[c] = datas[candidates[best]]
+            closest = distances[:, best].astype(np.float64)
+        return centroids
+
+    def calc_belong_cluster(self, datas, centroids, datas_norm):
+        '''
+        各点が所属するクラスタと，その重心までの二乗距離を計算する
+        距離行列はchunk_size点ずつ計算してメモリ使用量を抑える
+        '''
+        n = len(datas)
+        labels = np.empty(n, dtype=np.intp)
+        min_distances = np.empty(n, dtype=datas.dtype)
+        for start in range(0, n, self.chunk_size):
+            end = min(start + self.chunk_size, n)
+            distances = squared_distances(datas[start:end], centroids,
+                                          datas_norm[start:end])
+            labels[start:end] = distances.argmin(axis=1)
+            min_distances[start:end] = distances[np.arange(end - start),
+                                                 labels[start:end]]
+        return labels, min_distances
+
+
+class MiniBatchKMeams(object):
+    '''
+    mini-batch k-means (Sculley, 2010)
+    チャンクごとにpartial_fitを呼んで重心を逐次更新するので，メモリ使用量は
+    チャンクの大きさで決まる．各重心の学習率はそれまでに割り当てられた点数の逆数
+    '''
+
+    def __init__(self, cluster_num, dtype=None, random_state=None,
+                 chunk_size=65536):
+        '''
+        初期重心はseedに渡した標本 (reservoir_sampleで入力全体から一様に選んだもの)
+        からk-means++で選ぶ (KMeamsと同じ)．seedを呼ばずにpartial_fitした場合は
+        最初のチャンクから選ぶので，入力の順序がランダム (i.i.d.) であることを仮定する
+        '''
+        self.cluster_num = cluster_num
+        self.dtype = dtype
+        self.engine = KMeams(cluster_num, chunk_size=chunk_size)
+        self.rng = np.random.default_rng(random_state)
+        self.centroids = None
+        self.counts = None
+        self.n_batches = 0
+
+    def seed(self, datas):
+        '''
+        datasからk-means++で初期重心を選ぶ (datasの点は重心の更新には使わない)
+        '''
+        datas = as_float_array(datas, self.dtype)
+        if len(datas) < self.cluster_num:
+            raise ValueError('seed (%d points) must have at least '
+                             'cluster_num (%d) points'
+                             % (len(datas), self.cluster_num))
+        self.dtype = datas.dtype
+        self.centroids = self.engine.set_initial_centroids(datas,
+                                                           squared_norms(datas),
+                                                           self.rng)
+        self.counts = np.zeros(self.cluster_num, dtype=np.int64)
+        return self
 
-    def set_initial_centroids(self, datas):
+    def partial_fit(self, datas):
         '''
-        重心位置をデータの最大値に対する比率に変換する
+        datasの点で重心を更新する
         '''
-        for centroid in self.centroids:
-            centroid *= max(datas)
+        datas = as_float_array(datas, self.dtype)
+        if self.centroids is None:
+            self.seed(datas)
+        datas_norm = squared_norms(datas)
+        labels, min_distances = self.engine.calc_belong_cluster(datas,
+                                                                self.centroids,
+                                                                datas_norm)
+        counts, sums = cluster_sums(datas, labels, self.cluster_num)
+        self.counts += counts
+        # c <- c + (sum - n*c)/N : 1点ずつ学習率1/Nで更新するのと同じ
+        updated = counts > 0
+        step = (sums[updated] - counts[updated, np.newaxis] * self.centroids[updated]) \
+            / self.counts[updated, np.newaxis]
+        self.centroids[updated] += step.astype(self.dtype)
+        self.n_batches += 1
+        return self
 
-    def calc_belong_cluster(self, datas, centroids):
+    def predict(self, datas):
         '''
-        各点が所属するクラスタを計算する
+        datasの各点に最も近い重心のインデックスを返す
         '''
-        for data in datas:
+        datas = as_float_array(datas, self.dtype)
+        labels, min_distances = self.engine.calc_belong_cluster(datas,
+                                                                self.centroids,
+                                                                squared_norms(datas))
+        return labels
@@ -7,12 +7,27 @@ Usage:
     $python gmm.py -f DATASET.csv -n number of mixture components
 
     $python gmm.py -f data1.csv -n 5
+
+    $python gmm.py -f data1.csv -n 5 --engine numpy --covariance diag
+
+    $python gmm.py -f data1.csv --sweep 2-10 --criterion bic
+
+    $python gmm.py -f points.csv -n 5 --online --chunkSize 100000 --sampleSize 10000 -o labels.txt
 """
 
+import sys
 import csv
 from optparse import OptionParser
 import matplotlib.pyplot as plt
-from sklearn.mixture import GaussianMixture
+try:
+    from sklearn.mixture import GaussianMixture
+except ImportError:                                     # numpy engine only
+    GaussianMixture = None
+
+from my_gmm import GaussianMixtureEM, OnlineGaussianMixtureEM
+from no6_clustering.my_kmeans import reservoir_sample
+from no6_clustering.feature_cache import loadFeatures, featureChunks
+from no6_clustering.model_sweep import sweep, printReports, parseCandidates
 
 ##################
 # クラスタリング結果を返すように実装してください．
@@ -20,18 +35,57 @@ from sklearn.mixture import GaussianMixture
 # [3, 1, 0, 2, 1, 0]
 # この場合，要素の一つ目がクラスタ3に，二つ目がクラスタ1に属していることを意味しています．
 ##################
-def clustering(feature, n):
-    pred = GaussianMixture(n_components=n).fit_predict(feature)
+def clustering(feature, n, engine='sklearn', covarianceType='full'):
+    # engine='numpy' は my_gmm.GaussianMixtureEM (k-meansで初期化 / 対数空間のEM) を使う
+    if engine == 'numpy':
+        model = GaussianMixtureEM(n, covarianceType, random_state=10)
+        pred = model.fit_predict(feature)
+        sys.stderr.write('em: %s after %d iterations, log-likelihood %.4f\n'
+                         % ('converged' if model.converged else 'not converged',
+                            model.n_iter, model.log_likelihood))
+        return pred
+    pred = GaussianMixture(n_components=n,
+                           covariance_type=covarianceType).fit_predict(feature)
     return pred
 ##################
 
-def dataFromFile(fname):
-        """Function which reads from the file and yields a generator"""
-        file_iter = open(fname, 'rU')
-        for line in file_iter:
-                line = line.strip().rstrip(',')                         # Remove trailing comma
-                record = line.split(',')
-                yield record
+def fitGaussianMixture(feature, n, engine='sklearn', covarianceType='full'):
+    """
+    no6_clustering.model_sweep.sweep から各プロセスで呼ばれる: n個の混合成分でEMを実行し，
+    モデル，クラスタインデックス，BIC，AICを返す
+    """
+    if engine == 'numpy':
+        model = GaussianMixtureEM(n, covarianceType, random_state=10).fit(feature)
+        return {'model': model, 'labels': model.predict(feature),
+                'bic': model.bic(feature), 'aic': model.aic(feature)}
+    model = GaussianMixture(n_components=n, covariance_type=covarianceType,
+                            random_state=10).fit(feature)
+    return {'model': model, 'labels': model.predict(feature),
+            'bic': float(model.bic(feature)), 'aic': float(model.aic(feature))}
+
+def streamingClustering(fname, n, chunkSize, covarianceType='full', cache=True,
+                        sampleSize=10000):
+    """
+    stepwise EM: 1回目の読み込みで全体から一様にsampleSize点を選んで初期値を決め，
+    2回目の読み込みでチャンクごとに十分統計量とパラメータを更新し，
+    3回目の読み込みでチャンクごとにクラスタインデックスを返す
+    メモリ使用量はチャンクの大きさとsampleSizeで決まる
+    """
+    model = OnlineGaussianMixtureEM(n, covarianceType, random_state=10)
+    model.seed(reservoir_sample(featureChunks(fname, chunkSize, cache),
+                                sampleSize, 10))
+    for chunk in featureChunks(fname, chunkSize, cache):
+        model.partial_fit(chunk)
+    # 最終的なモデルでの1点あたりの対数尤度
+    count = 0
+    logLikelihood = 0.0
+    for chunk in featureChunks(fname, chunkSize, cache):
+        labels, logLikelihoods = model.predict_log_likelihood(chunk)
+        count += len(chunk)
+        logLikelihood += float(logLikelihoods.sum())
+        yield labels
+    sys.stderr.write('online em: %d points in %d chunks, log-likelihood %.4f\n'
+                     % (count, model.n_batches, logLikelihood / max(count, 1)))
 
 if __name__ == '__main__':
 
@@ -40,25 +94,91 @@ if __name__ == '__main__':
                          dest='input',
                          help='filename containing csv',
                          default=None)
+    optparser.add_option('--noCache',
+                         dest='noCache',
+                         help='parse the csv without reading or writing its .npy cache',
+                         default=False,
+                         action='store_true')
     optparser.add_option('-n',
                          dest='n',
                          help='number of mixture components',
                          default=3,
                          type='int')
+    optparser.add_option('--engine',
+                         dest='engine',
+                         help='EM engine: sklearn or numpy (my_gmm.GaussianMixtureEM)',
+                         default='sklearn',
+                         type='choice',
+                         choices=['sklearn', 'numpy'])
+    optparser.add_option('--covariance',
+                         dest='covariance',
+                         help='covariance type of the components: full, diag or spherical',
+                         default='full',
+                         type='choice',
+                         choices=['full', 'diag', 'spherical'])
+    optparser.add_option('--online',
+                         dest='online',
+                         help='stream the file through stepwise EM (seeded from a uniform sample of --sampleSize points) and write the labels instead of plotting; the updates assume the points are not ordered by cluster, shuffle sorted files first for the best fit',
+                         default=False,
+                         action='store_true')
+    optparser.add_option('--chunkSize',
+                         dest='chunkSize',
+                         help='number of points per chunk of --online',
+                         default=100000,
+                         type='int')
+    optparser.add_option('--sampleSize',
+                         dest='sampleSize',
+                         help='number of points sampled to seed --online',
+                         default=10000,
+                         type='int')
+    optparser.add_option('--sweep',
+                         dest='sweep',
+                         help='fit every n of a range (2-10) or list (2,4,8) in parallel and plot the best one',
+                         default=None)
+    optparser.add_option('--criterion',
+                         dest='criterion',
+                         help='model selection criterion of --sweep: bic, aic, silhouette or inertia',
+                         default='bic',
+                         type='choice',
+                         choices=['bic', 'aic', 'silhouette', 'inertia'])
+    optparser.add_option('-w', '--workers',
+                         dest='workers',
+                         help='number of worker processes of --sweep (one per n by default)',
+                         default=None,
+                         type='int')
+    optparser.add_option('-o', '--output',
+                         dest='output',
+                         help='file the labels of --online are written to (stdout by default)',
+                         default=None)
     (options, args) = optparser.parse_args()
-    inFile = None
-    if options.input is None:
-            inFile = sys.stdin
-    elif options.input is not None:
-            inFile = dataFromFile(options.input)
-    else:
-            print('No dataset filename specified, system with exit\n')
-            sys.exit('System will exit')
     n = options.n
-    feature=[]
-    for record in inFile:
-        feature.append(list(map(float, record)))
-    pred = clustering(feature,n)
+    if options.online:
+        # 全点をメモリに載せないので，ラベルを1行1点で書き出す (プロットはしない)
+        if options.input is None:
+            sys.exit('--online reads the input file three times, -f is required')
+        out = sys.stdout if options.output is None else open(options.output, 'w')
+        for labels in streamingClustering(options.input, n, options.chunkSize,
+                                          options.covariance,
+                                          cache=not options.noCache,
+                                          sampleSize=options.sampleSize):
+            out.write(''.join('%d\n' % label for label in labels))
+        if out is not sys.stdout:
+            out.close()
+        sys.exit()
+    # 2回目以降はcsvを解析せず，DATASET.csv.npy をメモリマップして読む
+    feature = loadFeatures(sys.stdin if options.input is None else options.input,
+                           cache=not options.noCache)
+    if options.sweep is not None:
+        # 各nを並列に実行し，criterionで最も良いものをプロットする
+        best, reports = sweep(feature, parseCandidates(options.sweep),
+                              fitGaussianMixture, options.criterion,
+                              options.workers, engine=options.engine,
+                              covarianceType=options.covariance)
+        printReports(reports, best, 'n')
+        n = best['k']
+        pred = best['labels']
+    else:
+        pred = clustering(feature,n,options.engine,options.covariance)
 
     #plot nodes
     plt.title("EM")
@@ -0,0 +1,323 @@
+import numpy as np
+
+from no6_clustering.my_kmeans import KMeams, as_float_array
+
+
+def logsumexp(values):
+    '''
+    各行についてlog(sum(exp(values)))を桁あふれなく計算する
+    '''
+    largest = values.max(axis=1, keepdims=True)
+    largest[~np.isfinite(largest)] = 0
+    return np.log(np.exp(values - largest).sum(axis=1)) + largest[:, 0]
+
+
+class GaussianMixtureEM(object):
+    '''
+    EMアルゴリズムによる混合ガウス分布
+    負担率は対数空間でlog-sum-expを使って計算し，E/Mステップとも
+    numpyの行列演算で行う (点ごとのループは持たない)
+    '''
+
+    def __init__(self, n_components, covariance_type='full', tol=1e-3,
+                 max_iter=100, reg_covar=1e-6, init='kmeans',
+                 random_state=None, dtype=None):
+        '''
+        covariance_type : 'full' (成分ごとの共分散行列)，'diag' (対角)，
+                          'spherical' (成分ごとに1つの分散)
+        tol             : 1点あたりの対数尤度の増加がtol未満で収束とする
+        reg_covar       : 共分散の対角成分に加える正則化項
+        init            : 'kmeans' (my_kmeans.KMeamsの結果から開始) か 'random'
+        '''
+        self.n_components = n_components
+        self.covariance_type = covariance_type
+        self.tol = tol
+        self.max_iter = max_iter
+        self.reg_covar = reg_covar
+        self.init = init
+        self.random_state = random_state
+        self.dtype = dtype
+        self.weights = None
+        self.means = None
+        self.covariances = None
+        self.precisions_cholesky = None
+        self.converged = False
+        self.n_iter = 0
+        # 最後のEステップでの1点あたりの対数尤度
+        self.log_likelihood = -np.inf
+
+    def fit(self, datas):
+        '''
+        n_components個の成分でEMを実行する
+        datasはlistのlist，または (点数 x 次元数) の配列を想定
+        '''
+        datas = as_float_array(datas, self.dtype)
+        if len(datas) < self.n_components:
+            raise ValueError('number of points (%d) must be >= n_components (%d)'
+                             % (len(datas), self.n_components))
+        self.m_step(datas, self.initial_responsibilities(datas))
+
+        self.converged = False
+        log_likelihood = -np.inf
+        for n_iter in range(1, self.max_iter + 1):
+            previous = log_likelihood
+            log_norm, log_resp = self.e_step(datas)
+            log_likelihood = float(log_norm.mean())
+            self.m_step(datas, np.exp(log_resp))
+            if abs(log_likelihood - previous) < self.tol:
+                self.converged = True
+                break
+        self.n_iter = n_iter
+        self.log_likelihood = log_likelihood
+        return self
+
+    def fit_predict(self, datas):
+        '''
+        EMを実行してdatasの各点の負担率が最大の成分のインデックスを返す
+        '''
+        datas = as_float_array(datas, self.dtype)
+        return self.fit(datas).predict(datas)
+
+    def predict(self, datas):
+        '''
+        datasの各点の負担率が最大の成分のインデックスを返す
+        '''
+        return self.weighted_log_prob(as_float_array(datas, self.dtype)).argmax(axis=1)
+
+    def predict_proba(self, datas):
+        '''
+        datasの各点の各成分の負担率を返す
+        '''
+        log_norm, log_resp = self.e_step(as_float_array(datas, self.dtype))
+        return np.exp(log_resp)
+
+    def predict_log_likelihood(self, datas):
+        '''
+        datasの各点の負担率が最大の成分のインデックスと，各点の対数尤度を返す
+        '''
+        weighted = self.weighted_log_prob(as_float_array(datas, self.dtype))
+        return weighted.argmax(axis=1), logsumexp(weighted)
+
+    def score(self, datas):
+        '''
+        datasの1点あたりの対数尤度を返す
+        '''
+        return float(logsumexp(self.weighted_log_prob(
+            as_float_array(datas, self.dtype))).mean())
+
+    def initial_responsibilities(self, datas):
+        '''
+        初期の負担率を返す．init='kmeans'ならk-meansのクラスタを1とする
+        '''
+        n = len(datas)
+        resp = np.zeros((n, self.n_components), dtype=datas.dtype)
+        if self.init == 'kmeans':
+            labels = KMeams(self.n_components, n_init=1,
+                            random_state=self.random_state).fit_predict(datas)
+            resp[np.arange(n), labels] = 1
+        else:
+            rng = np.random.default_rng(self.random_state)
+            resp[:] = rng.random((n, self.n_components))
+            resp /= resp.sum(axis=1, keepdims=True)
+        return resp
+
+    def e_step(self, datas):
+        '''
+        各点の対数尤度と，各成分の対数負担率を返す
+        '''
+        weighted = self.weighted_log_prob(datas)
+        log_norm = logsumexp(weighted)
+        return log_norm, weighted - log_norm[:, np.newaxis]
+
+    def m_step(self, datas, resp):
+        '''
+        負担率から混合比，平均，共分散を更新する
+        '''
+        counts = resp.sum(axis=0) + 10 * np.finfo(resp.dtype).eps
+        self.weights = counts / counts.sum()
+        self.means = (resp.T @ datas) / counts[:, np.newaxis]
+        dim = datas.shape[1]
+        if self.covariance_type == 'full':
+            covariances = np.empty((self.n_components, dim, dim))
+            for k in range(self.n_components):
+                diff = datas - self.means[k]
+                covariances[k] = (resp[:, k] * diff.T) @ diff / counts[k]
+                covariances[k].flat[::dim + 1] += self.reg_covar
+        else:
+            averages = (resp.T @ (datas * datas)) / counts[:, np.newaxis]
+            covariances = averages - self.means ** 2 + self.reg_covar
+            if self.covariance_type == 'spherical':
+                covariances = covariances.mean(axis=1)
+        self.covariances = covariances
+        self.precisions_cholesky = self.compute_precisions_cholesky(covariances)
+
+    def compute_precisions_cholesky(self, covariances):
+        '''
+        精度行列 (共分散の逆行列) のコレスキー因子を返す
+        diag / sphericalでは標準偏差の逆数
+        '''
+        if self.covariance_type == 'full':
+            try:
+                cholesky = np.linalg.cholesky(covariances)
+            except np.linalg.LinAlgError:
+                raise ValueError('ill-defined covariance, increase reg_covar '
+                                 'or decrease n_components')
+            dim = covariances.shape[1]
+            return np.transpose(np.linalg.solve(cholesky, np.eye(dim)), (0, 2, 1))
+        if (covariances <= 0).any():
+            raise ValueError('ill-defined covariance, increase reg_covar '
+                             'or decrease n_components')
+        return 1 / np.sqrt(covariances)
+
+    def weighted_log_prob(self, datas):
+        '''
+        log(混合比) + log N(x | 平均, 共分散) を (点数 x 成分数) で返す
+        '''
+        n, dim = datas.shape
+        precisions = self.precisions_cholesky
+        if self.covariance_type == 'full':
+            log_det = np.log(np.diagonal(precisions, axis1=1, axis2=2)).sum(axis=1)
+            mahalanobis = np.empty((n, self.n_components))
+            for k in range(self.n_components):
+                y = datas @ precisions[k] - self.means[k] @ precisions[k]
+                mahalanobis[:, k] = np.einsum('ij,ij->i', y, y)
+        else:
+            if self.covariance_type == 'spherical':
+                precisions = np.repeat(precisions[:, np.newaxis], dim, axis=1)
+            log_det = np.log(precisions).sum(axis=1)
+            squared = precisions ** 2
+            mahalanobis = (datas * datas) @ squared.T \
+                - 2 * datas @ (self.means * squared).T \
+                + (self.means ** 2 * squared).sum(axis=1)
+        return -0.5 * (dim * np.log(2 * np.pi) + mahalanobis) + log_det \
+            + np.log(self.weights)
+
+    def n_parameters(self, dim):
+        '''
+        自由パラメータ数を返す
+        '''
+        k = self.n_components
+        covariance = {'full': k * dim * (dim + 1) // 2,
+                      'diag': k * dim,
+                      'spherical': k}[self.covariance_type]
+        return covariance + k * dim + k - 1
+
+    def bic(self, datas):
+        '''
+        ベイズ情報量規準 (小さいほど良い)
+        '''
+        datas = as_float_array(datas, self.dtype)
+        return -2 * self.score(datas) * len(datas) \
+            + self.n_parameters(datas.shape[1]) * np.log(len(datas))
+
+    def aic(self, datas):
+        '''
+        赤池情報量規準 (小さいほど良い)
+        '''
+        datas = as_float_array(datas, self.dtype)
+        return -2 * self.score(datas) * len(datas) \
+            + 2 * self.n_parameters(datas.shape[1])
+
+
+class OnlineGaussianMixtureEM(GaussianMixtureEM):
+    '''
+    stepwise EM (Cappé & Moulines, 2009 / Liang & Klein, 2009) による混合ガウス分布
+    チャンクごとにpartial_fitを呼び，十分統計量 (負担率の和，負担率で重み付けた
+    xとxx^Tの和，いずれも1点あたり) を s <- (1 - η)s + η s_chunk で更新するので，
+    メモリ使用量はチャンクの大きさで決まる
+    η = (チャンクの点数 / それまでの点数)^decay で，decay=1なら全点の平均と同じ．
+    decayが小さいほど古いチャンクの負担率を早く忘れる (0.5 < decay <= 1) が，
+    点が並んでいる (クラスタごとに固まっている) と最近のチャンクに引きずられる
+    初期値はseedに渡した標本 (reservoir_sampleで入力全体から一様に選んだもの) での
+    バッチEMで決める．seedを呼ばずにpartial_fitした場合は最初のチャンクで決めるので，
+    入力の順序がランダム (i.i.d.) であることを仮定する
+    '''
+
+    def __init__(self, n_components, covariance_type='full', decay=1.0,
+                 tol=1e-3, max_iter=100, reg_covar=1e-6, init='kmeans',
+                 random_state=None, dtype=None):
+        '''
+        tol, max_iter, initは初期値を決めるバッチEMに使う
+        '''
+        super(OnlineGaussianMixtureEM, self).__init__(
+            n_components, covariance_type, tol, max_iter, reg_covar, init,
+            random_state, dtype)
+        self.decay = decay
+        self.statistics = None
+        # 十分統計量に含まれる点数 (seedの標本を含む)
+        self.n_seen = 0
+        self.n_batches = 0
+
+    def seed(self, datas):
+        '''
+        datasでバッチEMを実行して初期値とし，その十分統計量をdatasの点数分の
+        重みで持つ (以降のチャンクで初期値が上書きされ過ぎないように)
+        '''
+        datas = as_float_array(datas, self.dtype)
+        if len(datas) < self.n_components:
+            raise ValueError('seed (%d points) must have at least '
+                             'n_components (%d) points'
+                             % (len(datas), self.n_components))
+        self.dtype = datas.dtype
+        GaussianMixtureEM.fit(self, datas)
+        self.statistics = self.sufficient_statistics(datas,
+                                                     self.predict_proba(datas))
+        self.set_parameters(self.statistics)
+        self.n_seen = len(datas)
+        return self
+
+    def partial_fit(self, datas):
+        '''
+        datasの点で十分統計量とパラメータを更新する
+        '''
+        datas = as_float_array(datas, self.dtype)
+        if self.statistics is None:
+            self.seed(datas)
+            self.n_batches += 1
+            return self
+        step = (len(datas) / float(self.n_seen + len(datas))) ** self.decay
+        log_norm, log_resp = self.e_step(datas)
+        statistics = self.sufficient_statistics(datas, np.exp(log_resp))
+        self.statistics = [(1 - step) * old + step * new
+                           for old, new in zip(self.statistics, statistics)]
+        self.set_parameters(self.statistics)
+        self.n_seen += len(datas)
+        self.n_batches += 1
+        return self
+
+    def sufficient_statistics(self, datas, resp):
+        '''
+        1点あたりの十分統計量 (負担率の和，Σ r x，Σ r xx^T (full以外は対角)) を返す
+        '''
+        n = len(datas)
+        counts = resp.sum(axis=0) / n
+        sums = (resp.T @ datas) / n
+        if self.covariance_type == 'full':
+            dim = datas.shape[1]
+            seconds = np.empty((self.n_components, dim, dim))
+            for k in range(self.n_components):
+                seconds[k] = (resp[:, k] * datas.T) @ datas / n
+        else:
+            seconds = (resp.T @ (datas * datas)) / n
+        return [counts, sums, seconds]
+
+    def set_parameters(self, statistics):
+        '''
+        十分統計量から混合比，平均，共分散を求める
+        '''
+        counts, sums, seconds = statistics
+        counts = counts + 10 * np.finfo(counts.dtype).eps
+        self.weights = counts / counts.sum()
+        self.means = sums / counts[:, np.newaxis]
+        if self.covariance_type == 'full':
+            covariances = seconds / counts[:, np.newaxis, np.newaxis] \
+                - self.means[:, :, np.newaxis] * self.means[:, np.newaxis, :]
+            dim = covariances.shape[1]
+            covariances.reshape(self.n_components, -1)[:, ::dim + 1] += self.reg_covar
+        else:
+            covariances = seconds / counts[:, np.newaxis] - self.means ** 2 \
+                + self.reg_covar
+            if self.covariance_type == 'spherical':
+                covariances = covariances.mean(axis=1)
+        self.covariances = covariances
+        self.precisions_cholesky = self.compute_precisions_cholesky(covariances)
@@ -0,0 +1,127 @@
+"""
+Description     : Shared CSV loader used by kmeans.py / dbscan.py / gmm.py
+
+Parses a csv of points (one point per line, trailing commas allowed) straight
+into a contiguous (points x dims) float64 array, and saves it next to the
+source as a .npy sidecar cache:
+    DATASET.csv.npy         the array
+    DATASET.csv.npy.stamp   mtime (ns) and size of DATASET.csv it was made from
+Later runs memory-map the sidecar instead of parsing the csv again, as long as
+the stamp still matches the source file.
+
+Usage:
+    feature = loadFeatures('crater.csv')
+    for chunk in featureChunks('points.csv', 100000):
+        ...
+"""
+
+import os
+from itertools import chain, islice
+
+import numpy as np
+
+
+def cachePaths(fname):
+    """returns the paths of the sidecar array and of its stamp"""
+    return fname + '.npy', fname + '.npy.stamp'
+
+
+def sourceStamp(fname):
+    """returns the mtime (ns) and size of fname as one line of text"""
+    stat = os.stat(fname)
+    return '%d %d' % (stat.st_mtime_ns, stat.st_size)
+
+
+def parseFeatures(lines):
+    """
+    parses csv lines into a contiguous (points x dims) float64 array; the
+    number of columns is taken from the first line, so trailing commas are
+    ignored (as are blank lines)
+    """
+    lines = iter(lines)
+    for first in lines:
+        if first.strip():
+            break
+    else:
+        return np.empty((0, 0))
+    columns = len(first.strip().rstrip(',').split(','))
+    return np.ascontiguousarray(np.loadtxt(chain([first], lines), delimiter=',',
+                                           ndmin=2, usecols=range(columns),
+                                           dtype=np.float64))
+
+
+def cachedFeatures(fname):
+    """
+    Returns the sidecar array of fname memory-mapped read only, or None if
+    there is none or it was made from another version of fname
+    """
+    path, stampPath = cachePaths(fname)
+    try:
+        with open(stampPath, 'r') as stampFile:
+            if stampFile.read().strip() != sourceStamp(fname):
+                return None
+        return np.load(path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+
+
+def writeCache(fname, feature):
+    """
+    Saves feature as the sidecar of fname. The stamp is written last, so an
+    interrupted write leaves no valid cache. Unwritable directories are skipped
+    """
+    path, stampPath = cachePaths(fname)
+    stamp = sourceStamp(fname)
+    try:
+        if os.path.exists(stampPath):
+            os.remove(stampPath)
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as arrayFile:
+            np.save(arrayFile, feature)
+        os.replace(temporary, path)
+        with open(stampPath, 'w') as stampFile:
+            stampFile.write(stamp + '\n')
+    except OSError:
+        pass
+
+
+def loadFeatures(fname, cache=True):
+    """
+    Returns the points of the csv fname (a path, or an open file such as
+    sys.stdin, which is never cached) as a (points x dims) float64 array.
+    With cache, a valid sidecar is memory-mapped instead of parsing, and a
+    missing or stale one is (re)written
+    """
+    if hasattr(fname, 'read'):
+        return parseFeatures(fname)
+    if cache:
+        feature = cachedFeatures(fname)
+        if feature is not None:
+            return feature
+    with open(fname, 'r') as inFile:
+        feature = parseFeatures(inFile)
+    if cache:
+        writeCache(fname, feature)
+    return feature
+
+
+def featureChunks(fname, chunkSize, cache=True):
+    """
+    Yields the points of the csv fname as float64 arrays of chunkSize rows,
+    from the memory-mapped sidecar if it is valid (and cache is set), or else
+    parsing the file chunkSize lines at a time (the whole file is never held
+    in memory)
+    """
+    feature = cachedFeatures(fname) if cache else None
+    if feature is not None:
+        for start in range(0, len(feature), chunkSize):
+            yield np.asarray(feature[start:start + chunkSize])
+        return
+    with open(fname, 'r') as inFile:
+        while True:
+            lines = list(islice(inFile, chunkSize))
+            if not lines:
+                break
+            chunk = parseFeatures(lines)
+            if len(chunk):
+                yield chunk
@@ -7,27 +7,74 @@ Usage:
     $python kmeans.py -f DATASET.csv -k No.clusters
 
     $python kmeans.py -f crater.csv -k 3
+
+    $python kmeans.py -f crater.csv -k 3 --engine numpy
+
+    $python kmeans.py -f crater.csv -k 9 --engine hamerly
+
+    $python kmeans.py -f crater.csv --sweep 2-10 --criterion silhouette --engine numpy
+
+    $python kmeans.py -f points.csv -k 3 --minibatch --chunkSize 100000 --sampleSize 10000 -o labels.txt
 """
-from sklearn.cluster import KMeans
+import sys
+try:
+    from sklearn.cluster import KMeans
+except ImportError:                                     # numpy engine only
+    KMeans = None
 import csv
 from collections import defaultdict
 from optparse import OptionParser
 import matplotlib.pyplot as plt
 
+from my_kmeans import KMeams, MiniBatchKMeams, reservoir_sample
+from feature_cache import loadFeatures, featureChunks
+from model_sweep import sweep, printReports, parseCandidates
+
 ##################
 # クラスタリング結果を返すように実装してください
-def clustering(feature, k):
+def clustering(feature, k, engine='sklearn'):
+    # engine='numpy' は my_kmeans.KMeams (k-means++ / numpyでベクトル化) を使う
+    if engine == 'numpy':
+        return KMeams(k, random_state=10).fit_predict(feature)
+    # engine='hamerly' は三角不等式で不要な距離計算を省く (結果はnumpyと同じ)
+    if engine == 'hamerly':
+        model = KMeams(k, random_state=10, algorithm='hamerly')
+        pred = model.fit_predict(feature)
+        sys.stderr.write('hamerly: %d of %d distance computations saved\n'
+                         % (model.n_distances_saved, model.n_distances_lloyd))
+        return pred
     pred = KMeans(n_clusters=k, random_state=10).fit_predict(feature)
     return pred
 ##################
 
-def dataFromFile(fname):
-        """Function which reads from the file and yields a generator"""
-        file_iter = open(fname, 'rU')
-        for line in file_iter:
-                line = line.strip().rstrip(',')                         # Remove trailing comma
-                record = line.split(',')
-                yield record
+def fitKMeans(feature, k, engine='numpy'):
+    """
+    model_sweep.sweep から各プロセスで呼ばれる: k個のクラスタでk-meansを実行し，
+    モデル，クラスタインデックス，inertiaを返す
+    """
+    if engine == 'sklearn':
+        model = KMeans(n_clusters=k, random_state=10).fit(feature)
+        return {'model': model, 'labels': model.labels_,
+                'inertia': float(model.inertia_)}
+    algorithm = 'hamerly' if engine == 'hamerly' else 'lloyd'
+    model = KMeams(k, random_state=10, algorithm=algorithm).fit(feature)
+    return {'model': model, 'labels': model.labels, 'inertia': model.inertia}
+
+def streamingClustering(fname, k, chunkSize, cache=True, sampleSize=10000):
+    """
+    mini-batch k-means: 1回目の読み込みで全体から一様にsampleSize点を選んで
+    k-means++で初期重心を決め，2回目の読み込みでチャンクごとに重心を更新し，
+    3回目の読み込みでチャンクごとにクラスタインデックスを返す
+    メモリ使用量はチャンクの大きさとsampleSizeで決まる
+    """
+    model = MiniBatchKMeams(k, random_state=10, chunk_size=chunkSize)
+    model.seed(reservoir_sample(featureChunks(fname, chunkSize, cache),
+                                sampleSize, 10))
+    for chunk in featureChunks(fname, chunkSize, cache):
+        model.partial_fit(chunk)
+    for chunk in featureChunks(fname, chunkSize, cache):
+        yield model.predict(chunk)
+
 if __name__ == '__main__':
 
     optparser = OptionParser()
@@ -35,30 +82,88 @@ if __name__ == '__main__':
                          dest='input',
                          help='filename containing csv',
                          default=None)
+    optparser.add_option('--noCache',
+                         dest='noCache',
+                         help='parse the csv without reading or writing its .npy cache',
+                         default=False,
+                         action='store_true')
     optparser.add_option('-k',
                          dest='k',
                          help='number of clusters',
                          default=3,
                          type='int')
+    optparser.add_option('--engine',
+                         dest='engine',
+                         help='k-means engine: sklearn, numpy (my_kmeans.KMeams) or hamerly (bounded my_kmeans.KMeams)',
+                         default='sklearn',
+                         type='choice',
+                         choices=['sklearn', 'numpy', 'hamerly'])
+    optparser.add_option('--minibatch',
+                         dest='minibatch',
+                         help='stream the file through mini-batch k-means (seeded from a uniform sample of --sampleSize points) and write the labels instead of plotting; the updates assume the points are not ordered by cluster, shuffle sorted files first for the best fit',
+                         default=False,
+                         action='store_true')
+    optparser.add_option('--chunkSize',
+                         dest='chunkSize',
+                         help='number of points per mini-batch',
+                         default=100000,
+                         type='int')
+    optparser.add_option('--sampleSize',
+                         dest='sampleSize',
+                         help='number of points sampled to seed --minibatch',
+                         default=10000,
+                         type='int')
+    optparser.add_option('--sweep',
+                         dest='sweep',
+                         help='fit every k of a range (2-10) or list (2,4,8) in parallel and plot the best one',
+                         default=None)
+    optparser.add_option('--criterion',
+                         dest='criterion',
+                         help='model selection criterion of --sweep: silhouette, bic, aic or inertia',
+                         default='silhouette',
+                         type='choice',
+                         choices=['silhouette', 'bic', 'aic', 'inertia'])
+    optparser.add_option('-w', '--workers',
+                         dest='workers',
+                         help='number of worker processes of --sweep (one per k by default)',
+                         default=None,
+                         type='int')
+    optparser.add_option('-o', '--output',
+                         dest='output',
+                         help='file the labels of --minibatch are written to (stdout by default)',
+                         default=None)
     (options, args) = optparser.parse_args()
-    inFile = None
-    if options.input is None:
-            inFile = sys.stdin
-    elif options.input is not None:
-            inFile = dataFromFile(options.input)
-    else:
-            print('No dataset filename specified, system with exit\n')
-            sys.exit('System will exit')
     k = options.k
+    if options.minibatch:
+        # 全点をメモリに載せないので，ラベルを1行1点で書き出す (プロットはしない)
+        if options.input is None:
+            sys.exit('--minibatch reads the input file three times, -f is required')
+        out = sys.stdout if options.output is None else open(options.output, 'w')
+        for labels in streamingClustering(options.input, k, options.chunkSize,
+                                          cache=not options.noCache,
+                                          sampleSize=options.sampleSize):
+            out.write(''.join('%d\n' % label for label in labels))
+        if out is not sys.stdout:
+            out.close()
+        sys.exit()
 ##################
 #    pred は以下のようなリストが期待されます
 #    [1,0,0,2,1,0]
 #    この場合、要素の一つ目がクラスタ1に、二つ目がクラスタ0に属していることを意味しています
 ##################
-    feature=[]
-    for record in inFile:
-        feature.append(list(map(float,record)))
-    pred = clustering(feature,k)
+    # 2回目以降はcsvを解析せず，DATASET.csv.npy をメモリマップして読む
+    feature = loadFeatures(sys.stdin if options.input is None else options.input,
+                           cache=not options.noCache)
+    if options.sweep is not None:
+        # 各kを並列に実行し，criterionで最も良いものをプロットする
+        best, reports = sweep(feature, parseCandidates(options.sweep), fitKMeans,
+                              options.criterion, options.workers,
+                              engine=options.engine)
+        printReports(reports, best)
+        k = best['k']
+        pred = best['labels']
+    else:
+        pred = clustering(feature,k,options.engine)
 
 #plot nodes
     plt.title("kmeans")
@@ -72,6 +177,6 @@ if __name__ == '__main__':
         y[pred[i]].append(feature[i][1])
     color_list=['red','blue','yellow','green','purple','c', 'olivedrab','gray','pink']
     for i in range(len(x)):
-        plt.scatter(x[i],y[i],label=i, c=color_list[i])
+        plt.scatter(x[i],y[i],label=i, c=color_list[i % len(color_list)])
     plt.legend()
     plt.show()
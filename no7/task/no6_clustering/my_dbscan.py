@@ -0,0 +1,279 @@
+import hashlib
+
+import numpy as np
+from heapq import heappush, heappop
+from itertools import product
+
+
+def as_float_array(datas):
+    '''
+    datasを (点数 x 次元数) の連続したfloat64配列に変換する
+    '''
+    datas = np.ascontiguousarray(datas, dtype=np.float64)
+    if datas.ndim == 1:
+        datas = datas.reshape(-1, 1)
+    return datas
+
+
+def data_fingerprint(datas):
+    '''
+    datasの点の形と値から求めたSHA-256 (保存した結果がどのデータのものかの確認用)
+    '''
+    datas = as_float_array(datas)
+    digest = hashlib.sha256(repr(datas.shape).encode())
+    digest.update(datas.tobytes())
+    return digest.hexdigest()
+
+
+def connected_components(n, src, dst):
+    '''
+    辺 (src[i], dst[i]) で結ばれた点の連結成分を求め，各点の成分の代表
+    (成分内で最小の点インデックス) を返す
+    根どうしを小さい方へつなぎ，ポインタジャンプで木を潰すことを繰り返す
+    '''
+    parent = np.arange(n)
+    while True:
+        roots_src = parent[src]
+        roots_dst = parent[dst]
+        low = np.minimum(roots_src, roots_dst)
+        high = np.maximum(roots_src, roots_dst)
+        merged = low != high
+        if not merged.any():
+            return parent
+        np.minimum.at(parent, high[merged], low[merged])
+        while True:
+            grand = parent[parent]
+            if (grand == parent).all():
+                break
+            parent = grand
+
+
+class NeighborGraph(object):
+    '''
+    半径max_eps以内の近傍グラフ
+    点を一辺max_epsの格子に振り分け，隣接する3^d個のセルの点どうしの距離だけを
+    計算する (低次元のデータ向け)．辺は (src, 距離) の順に並べて持つので，
+    max_eps以下の任意のepsとminPointsについてDBSCANのラベルを近傍探索なしで求められる
+    '''
+
+    def __init__(self, datas, max_eps, block_size=1 << 22):
+        '''
+        block_size : 一度に距離を計算する点の組の数の上限
+        '''
+        self.datas = as_float_array(datas)
+        self.max_eps = max_eps
+        self.block_size = block_size
+        self.src, self.dst, self.distances = self.build()
+
+    def build(self):
+        '''
+        格子で近傍点の組を列挙し，距離がmax_eps以下の組を (src, dst, 距離) で返す
+        '''
+        datas = self.datas
+        n, dim = datas.shape
+        empty = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp),
+                 np.empty(0))
+        if n == 0:
+            return empty
+        cells = np.floor((datas - datas.min(axis=0)) / self.max_eps).astype(np.int64)
+        # セル座標を1つの整数キーにする (隣接セルのため各軸に1つ余白を取る)
+        strides = np.cumprod(np.concatenate([[1], cells.max(axis=0)[:-1] + 3]))
+        keys = (cells + 1) @ strides
+        order = np.argsort(keys, kind='stable')
+        cell_keys, starts, sizes = np.unique(keys[order], return_index=True,
+                                             return_counts=True)
+
+        src, dst, distances = [], [], []
+        for offset in product((-1, 0, 1), repeat=dim):
+            neighbor_keys = cell_keys + np.dot(offset, strides)
+            found = np.searchsorted(cell_keys, neighbor_keys)
+            found = np.minimum(found, len(cell_keys) - 1)
+            matched = np.flatnonzero(cell_keys[found] == neighbor_keys)
+            pairs = (matched, found[matched])
+            for block in self.split_blocks(sizes[pairs[0]] * sizes[pairs[1]]):
+                s, d = self.block_pairs(order, starts, sizes,
+                                        pairs[0][block], pairs[1][block])
+                dist = np.sqrt(((datas[s] - datas[d]) ** 2).sum(axis=1))
+                kept = (dist <= self.max_eps) & (s != d)
+                src.append(s[kept])
+                dst.append(d[kept])
+                distances.append(dist[kept])
+        if not src:
+            return empty
+        src = np.concatenate(src)
+        dst = np.concatenate(dst)
+        distances = np.concatenate(distances)
+        edges = np.lexsort((distances, src))
+        return src[edges], dst[edges], distances[edges]
+
+    def split_blocks(self, pair_counts):
+        '''
+        セルの組を，点の組の数の合計がblock_size程度になるように分けたsliceを返す
+        '''
+        bounds = np.searchsorted(np.cumsum(pair_counts),
+                                 np.arange(self.block_size, pair_counts.sum(),
+                                           self.block_size), side='right')
+        bounds = np.unique(np.concatenate([[0], bounds, [len(pair_counts)]]))
+        return [slice(start, end) for start, end in zip(bounds[:-1], bounds[1:])
+                if end > start]
+
+    def block_pairs(self, order, starts, sizes, cells_a, cells_b):
+        '''
+        セルの組 (cells_a[i], cells_b[i]) の全ての点の組を (src, dst) で返す
+        '''
+        counts = sizes[cells_a] * sizes[cells_b]
+        pair_cell = np.repeat(np.arange(len(counts)), counts)
+        position = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                       counts)
+        width = sizes[cells_b][pair_cell]
+        src = order[starts[cells_a][pair_cell] + position // width]
+        dst = order[starts[cells_b][pair_cell] + position % width]
+        return src, dst
+
+    def labels(self, eps, min_points):
+        '''
+        eps (max_eps以下)，min_points (自身を含む近傍点数) でのDBSCANのラベルを返す
+        ノイズは-1，クラスタは最小の点インデックスの順に0から番号を振る．
+        複数のクラスタの境界にある点は最も近いコア点のクラスタに属する
+        '''
+        if eps > self.max_eps:
+            raise ValueError('eps (%g) must be <= max_eps (%g)'
+                             % (eps, self.max_eps))
+        n = len(self.datas)
+        within = self.distances <= eps
+        src = self.src[within]
+        dst = self.dst[within]
+        core = np.bincount(src, minlength=n) + 1 >= min_points
+
+        # コア点どうしの連結成分がクラスタになる
+        core_edges = core[src] & core[dst]
+        roots = connected_components(n, src[core_edges], dst[core_edges])
+        labels = np.full(n, -1, dtype=np.intp)
+        cluster_roots = np.unique(roots[core])
+        labels[core] = np.searchsorted(cluster_roots, roots[core])
+
+        # 境界点: 辺は距離順に並んでいるので，各点で最初のコア点が最も近い
+        border_edges = ~core[src] & core[dst]
+        border, first = np.unique(src[border_edges], return_index=True)
+        labels[border] = labels[dst[border_edges][first]]
+        return labels
+
+
+def dbscan(datas, eps, min_points):
+    '''
+    datasの各点のDBSCANのクラスタインデックス (ノイズは-1) を返す
+    '''
+    return NeighborGraph(datas, eps).labels(eps, min_points)
+
+
+class ReachabilityOrdering(object):
+    '''
+    OPTICS (Ankerst et al., 1999) の到達可能性順序
+    min_pointsとmax_epsで一度だけ計算して保存しておけば，max_eps以下の任意の
+    epsのDBSCAN相当のラベルが順序の線形走査 (ExtractDBSCAN) で求まる
+    '''
+
+    def __init__(self, ordering, reachability, core_distances, min_points,
+                 max_eps, fingerprint=None):
+        '''
+        fingerprint : 順序を計算したデータのdata_fingerprint
+        '''
+        self.ordering = ordering
+        self.reachability = reachability
+        self.core_distances = core_distances
+        self.min_points = min_points
+        self.max_eps = max_eps
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def compute(cls, datas, min_points, max_eps, graph=None):
+        '''
+        datasの到達可能性順序を計算する
+        graphにmax_eps以上の半径のNeighborGraphを渡せば近傍探索を省く
+        '''
+        if graph is None:
+            graph = NeighborGraph(datas, max_eps)
+        within = graph.distances <= max_eps
+        src = graph.src[within]
+        dst = graph.dst[within]
+        distances = graph.distances[within]
+        n = len(graph.datas)
+        starts = np.searchsorted(src, np.arange(n + 1))
+
+        # コア距離: 自身を含めてmin_points個目の近傍点までの距離
+        core_distances = np.full(n, np.inf)
+        if min_points <= 1:
+            core_distances[:] = 0
+        else:
+            has_core = np.diff(starts) >= min_points - 1
+            core_distances[has_core] = distances[starts[:-1][has_core]
+                                                 + min_points - 2]
+
+        reachability = np.full(n, np.inf)
+        processed = np.zeros(n, dtype=bool)
+        ordering = np.empty(n, dtype=np.intp)
+        position = 0
+        heap = []
+        for point in range(n):
+            if processed[point]:
+                continue
+            heappush(heap, (np.inf, point))
+            while heap:
+                reach, current = heappop(heap)
+                if processed[current]:
+                    continue
+                processed[current] = True
+                ordering[position] = current
+                position += 1
+                if core_distances[current] == np.inf:
+                    continue
+                # 未処理の近傍点の到達可能距離を更新する
+                neighbors = dst[starts[current]:starts[current + 1]]
+                reaches = np.maximum(distances[starts[current]:starts[current + 1]],
+                                     core_distances[current])
+                better = ~processed[neighbors] & (reaches < reachability[neighbors])
+                neighbors = neighbors[better]
+                reaches = reaches[better]
+                reachability[neighbors] = reaches
+                for item in zip(reaches.tolist(), neighbors.tolist()):
+                    heappush(heap, item)
+        return cls(ordering, reachability, core_distances, min_points, max_eps,
+                   data_fingerprint(graph.datas))
+
+    def labels(self, eps):
+        '''
+        eps (max_eps以下) でのDBSCAN相当のラベルを返す (ノイズは-1)
+        順序に沿って，到達可能距離がepsを超えたところでコア点なら新しいクラスタ，
+        コア点でなければノイズとする．境界点はDBSCANと異なりノイズになることがある
+        '''
+        if eps > self.max_eps:
+            raise ValueError('eps (%g) must be <= max_eps (%g)'
+                             % (eps, self.max_eps))
+        reachability = self.reachability[self.ordering]
+        core = self.core_distances[self.ordering] <= eps
+        unreachable = reachability > eps
+        clusters = np.cumsum(unreachable & core) - 1
+        labels = np.empty(len(self.ordering), dtype=np.intp)
+        labels[self.ordering] = np.where(unreachable & ~core, -1, clusters)
+        return labels
+
+    def save(self, path):
+        '''
+        npz形式で保存する
+        '''
+        np.savez(path, ordering=self.ordering, reachability=self.reachability,
+                 core_distances=self.core_distances,
+                 min_points=self.min_points, max_eps=self.max_eps,
+                 fingerprint=self.fingerprint or '')
+
+    @classmethod
+    def load(cls, path):
+        '''
+        saveで保存した順序を読み込む (fingerprintの無い古いファイルではNone)
+        '''
+        with np.load(path) as saved:
+            fingerprint = str(saved['fingerprint']) if 'fingerprint' in saved.files \
+                else None
+            return cls(saved['ordering'], saved['reachability'],
+                       saved['core_distances'], int(saved['min_points']),
+                       float(saved['max_eps']), fingerprint or None)